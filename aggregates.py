@@ -0,0 +1,591 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from conversations import SESSION_GAP_MINUTES, Conversations
+from emojis import extract_emojis
+from heavy_hitters import APPROX_MIN_MESSAGES, TOPK_CAPACITY, count_terms
+from links import extract_links
+from preprocessor import MONTHS
+from cache import estimate_size
+from search import SearchIndex
+from tokens import stop_words, tokenize
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+HOURS = list(range(24))
+
+# Date-range views kept per chat, the most recently used ones win
+MAX_WINDOWS = 16
+
+
+class ChatAggregates:
+    """
+    Per-user aggregates of a parsed chat. "Overall" is the sum of the per-user entries,
+    so switching user never re-scans the messages.
+    Calendar histograms are built up front; links, the token table, the emoji table and the
+    search index are each built in one pass on first use, so callers only pay for (and import)
+    what they read. Chats above APPROX_MIN_MESSAGES count words and emojis in bounded summaries
+    (see heavy_hitters.py) instead of the token and emoji tables.
+    """
+
+    def __init__(self, df):
+        self._attach(df)
+        self.approximate = len(df) > APPROX_MIN_MESSAGES
+
+        users = df['User'].astype('category')
+        self.users = users.cat.categories
+        self._user_codes = users.cat.codes.to_numpy().astype(np.intp)
+        n_users = len(self.users)
+
+        self.messages = np.bincount(self._user_codes, minlength=n_users)
+        self.media = np.bincount(self._user_codes, weights=(df['kind'] == 'media').to_numpy(),
+                                 minlength=n_users).astype(np.int64)
+
+        # Integer calendar codes of every row: weekday * 24 + hour, and months counted from January
+        # of the first year. Timeline and calendar histograms count messages with a body.
+        self._has_message = df['Message'].notna().to_numpy()
+        self._hour_codes = (df['Timestamp'].dt.dayofweek.to_numpy() * 24 + df['hour'].to_numpy()).astype(np.uint8)
+        self._first_year = int(df['year'].min()) if len(df) else 0
+        year = df['year'].to_numpy().astype(np.int32)
+        self._month_codes = (year - self._first_year) * 12 + df['month_num'].to_numpy() - 1
+        self._count_calendar()
+
+    def _count_calendar(self):
+        n_users = len(self.users)
+        cell = self._user_codes * 7 * 24 + self._hour_codes
+        self.calendar = np.bincount(cell[self._has_message], minlength=n_users * 7 * 24).reshape(n_users, 7, 24)
+
+        n_months = int(self._month_codes.max()) + 1 if len(self._month_codes) else 0
+        cell = self._user_codes * n_months + self._month_codes
+        rows = np.bincount(cell, minlength=n_users * n_months).reshape(n_users, n_months)
+        messages = np.bincount(cell, weights=self._has_message, minlength=n_users * n_months).astype(np.int64)
+        self.monthly = _monthly_series(self.users, rows, messages.reshape(n_users, n_months), self._first_year)
+
+    def _attach(self, df):
+        # Only a weak reference, the store lives exactly as long as its frame
+        self._df_ref = weakref.ref(df)
+        self._lock = threading.RLock()
+        self._parts = {}
+        self._part_locks = {}
+        self._part_bytes = {}
+        self._windows = OrderedDict()
+
+    @property
+    def _df(self):
+        return self._df_ref()
+
+    def nbytes(self):
+        """
+        Estimated bytes held by the store: its arrays and histograms, the parts built so far and its
+        date-range views. Parts never change once built, so each is measured once.
+        """
+        with self._lock:
+            parts = dict(self._parts)
+            windows = list(self._windows.values())
+        for name in parts.keys() - self._part_bytes.keys():
+            self._part_bytes[name] = estimate_size(parts[name])
+        arrays = [value for value in vars(self).values()
+                  if isinstance(value, (np.ndarray, pd.DataFrame, pd.Series, pd.Index))]
+        return (estimate_size(arrays) + sum(self._part_bytes[name] for name in parts)
+                + sum(view.nbytes() for view in windows))
+
+    def extended(self, df):
+        """
+        Store of df, this store's frame with new rows appended (see preprocessor.preprocess_tail).
+        Only the new rows are scanned: their histograms and counts, and whichever token tables
+        were already built here, are merged into copies of this store's.
+        """
+        head_rows = len(self._user_codes)
+        new_rows = df.iloc[head_rows:]
+        tail = ChatAggregates(new_rows)
+
+        store = ChatAggregates.__new__(ChatAggregates)
+        store._attach(df)
+        store.approximate = len(df) > APPROX_MIN_MESSAGES
+        store.users = df['User'].astype('category').cat.categories
+        head_map = store.users.get_indexer(self.users)
+        tail_map = store.users.get_indexer(tail.users)
+        store._user_codes = np.concatenate([head_map[self._user_codes], tail_map[tail._user_codes]])
+
+        def per_user(head_values, tail_values):
+            merged = np.zeros((len(store.users), *head_values.shape[1:]), dtype=head_values.dtype)
+            merged[head_map] += head_values
+            merged[tail_map] += tail_values
+            return merged
+
+        def occurrences(head, tail, column):
+            return _concat([head, tail.assign(**{column: tail[column] + head_rows})], ignore_index=True)
+
+        store.messages = per_user(self.messages, tail.messages)
+        store.media = per_user(self.media, tail.media)
+        store._has_message = np.concatenate([self._has_message, tail._has_message])
+        store._hour_codes = np.concatenate([self._hour_codes, tail._hour_codes])
+        store._first_year = min(self._first_year, tail._first_year) if len(new_rows) else self._first_year
+        store._month_codes = np.concatenate([self._month_codes + (self._first_year - store._first_year) * 12,
+                                             tail._month_codes + (tail._first_year - store._first_year) * 12])
+        # Recounting the integer codes costs far less than merging the histograms' labels
+        store._count_calendar()
+
+        with self._lock:
+            parts = dict(self._parts)
+        if 'links' in parts:
+            head, tail_part = parts['links'], tail._build_links()
+            domains = _concat([head[1].assign(user=head_map[head[1]['user'].to_numpy()]),
+                               tail_part[1].assign(user=tail_map[tail_part[1]['user'].to_numpy()])])
+            domains = domains.groupby(['user', 'domain'], sort=False)['count'].sum().reset_index()
+            store._parts['links'] = (per_user(head[0], tail_part[0]),
+                                     domains.sort_values('count', ascending=False, kind='stable', ignore_index=True),
+                                     np.concatenate([head[2], tail_part[2]]),
+                                     occurrences(head[3], tail_part[3], 'position'))
+        if 'words' in parts:
+            head, tail_part = parts['words'], tail._build_words()
+            tokens = occurrences(head[1], tail_part[1], 'message_id')
+            tokens['user'] = pd.Categorical.from_codes(store._user_codes[tokens['message_id'].to_numpy()], store.users)
+            tokens['token'] = union_categoricals([head[1]['token'], tail_part[1]['token']])
+            table = _merge_counts((head_map, head[2], 0), (tail_map, tail_part[2], len(head[1])))
+            store._parts['words'] = (per_user(head[0], tail_part[0]), tokens, table,
+                                     np.concatenate([head[3], tail_part[3]]))
+        if 'emojis' in parts:
+            head, tail_part = parts['emojis'], tail._build_emojis()
+            table = _merge_counts((head_map, head[0], 0), (tail_map, tail_part[0], len(head[1])))
+            store._parts['emojis'] = (table, occurrences(head[1], tail_part[1], 'position'))
+        for kind in [key[1] for key in parts if isinstance(key, tuple) and key[0] == 'top']:
+            head, tail_part = parts['top', kind], tail._build_top(kind)
+            store._parts['top', kind] = (
+                head[0].merge(tail_part[0], head_map, tail_map, len(store.users)),
+                None if head[1] is None else np.concatenate([head[1], tail_part[1]]))
+        if 'search' in parts:
+            store._parts['search'] = SearchIndex.build(new_rows, store._user_codes, store._month_codes,
+                                                       len(store.users), head_rows, parts['search'])
+        return store
+
+    def window(self, start=None, end=None):
+        """
+        Aggregates of the messages sent from start up to (not including) end, either may be None.
+        The frame is sorted by Timestamp, so the window's rows are found by binary search, and its
+        histograms are cut from prefix sums instead of re-scanning the chat.
+        """
+        timestamps = self._df['Timestamp'].to_numpy()
+        first = 0 if start is None else int(np.searchsorted(timestamps, pd.Timestamp(start).to_datetime64()))
+        stop = len(timestamps) if end is None else int(np.searchsorted(timestamps, pd.Timestamp(end).to_datetime64()))
+        stop = max(first, stop)
+        if (first, stop) == (0, len(timestamps)):
+            return self
+
+        with self._lock:
+            view = self._windows.get((first, stop))
+            if view is None:
+                view = self._windows[first, stop] = WindowAggregates(self, first, stop)
+                while len(self._windows) > MAX_WINDOWS:
+                    self._windows.popitem(last=False)
+            self._windows.move_to_end((first, stop))
+            return view
+
+    def _part(self, name, build):
+        """
+        Builds a part once. Each part has its own lock, so threads can build different parts at the same time.
+        """
+        with self._lock:
+            if name in self._parts:
+                return self._parts[name]
+            lock = self._part_locks.setdefault(name, threading.Lock())
+        with lock:
+            with self._lock:
+                if name in self._parts:
+                    return self._parts[name]
+            part = build()
+            with self._lock:
+                self._parts[name] = part
+            return part
+
+    def _build_links(self):
+        return _links_part(self._user_codes, len(self.users), *extract_links(self._df['Message']))
+
+    def _build_words(self):
+        return _words_part(self._user_codes, self.users, *tokenize(self._df, stop_words()))
+
+    def _build_emojis(self):
+        return _emojis_part(self._user_codes, extract_emojis(self._df['Message']))
+
+    def _build_top(self, kind):
+        capacity = TOPK_CAPACITY if self.approximate else None
+        return count_terms(self._df, kind, self._user_codes, len(self.users), capacity)
+
+    def _build_search(self):
+        return SearchIndex.build(self._df, self._user_codes, self._month_codes, len(self.users))
+
+    def _build_user_sums(self):
+        weights = np.column_stack([np.ones(len(self._user_codes), dtype=np.int64),
+                                   (self._df['kind'] == 'media').to_numpy()])
+        return PrefixSums(self._user_codes, len(self.users), weights)
+
+    def _build_calendar_sums(self):
+        cell = self._user_codes * 7 * 24 + self._hour_codes
+        return PrefixSums(cell, len(self.users) * 7 * 24, self._has_message)
+
+    def _build_monthly_sums(self):
+        n_months = int(self._month_codes.max()) + 1 if len(self._month_codes) else 0
+        weights = np.column_stack([np.ones(len(self._month_codes), dtype=np.int64), self._has_message])
+        return PrefixSums(self._user_codes * n_months + self._month_codes, len(self.users) * n_months, weights)
+
+    @property
+    def counts(self):
+        return self._part('counts', lambda: pd.DataFrame({
+            'messages': self.messages,
+            'words': self._word_totals(),
+            'media': self.media,
+            'links': self._part('links', self._build_links)[0],
+        }, index=self.users))
+
+    def _word_totals(self):
+        if not self.approximate:
+            return self._part('words', self._build_words)[0]
+        num_words = self._part(('top', 'words'), lambda: self._build_top('words'))[1]
+        return np.bincount(self._user_codes, weights=num_words, minlength=len(self.users)).astype(np.int64)
+
+    @property
+    def tokens(self):
+        """
+        (message_id, user, token) table of the words left after media, notice, stopword and punctuation filtering
+        """
+        return self._part('words', self._build_words)[1]
+
+    def _rows(self, selected_user):
+        if selected_user == 'Overall':
+            return slice(None)
+        position = self.users.get_indexer([selected_user])[0]
+        return slice(position, position + 1) if position != -1 else slice(0, 0)
+
+    def message_count(self, selected_user):
+        return int(self.messages[self._rows(selected_user)].sum())
+
+    def media_count(self, selected_user):
+        return int(self.media[self._rows(selected_user)].sum())
+
+    def stats(self, selected_user):
+        return self.counts.iloc[self._rows(selected_user)].sum()
+
+    def domain_counts(self, selected_user):
+        domains = _select(self._part('links', self._build_links)[1], self._rows(selected_user))
+        return domains.groupby('domain')['count'].sum().sort_values(ascending=False, kind='stable')
+
+    def weekday_hour(self, selected_user):
+        return self.calendar[self._rows(selected_user)].sum(axis=0)
+
+    def monthly_counts(self, selected_user):
+        if selected_user == 'Overall':
+            return self.monthly.groupby(level=['year', 'month_num', 'month'], observed=True).sum()
+        try:
+            return self.monthly.xs(selected_user, level=0)
+        except KeyError:
+            # Unknown user, or nothing sent by them in this window
+            return self.monthly.iloc[:0].droplevel(0)
+
+    def emoji_counts(self, selected_user):
+        if self.approximate:
+            return self._estimated_counts('emojis', selected_user)
+        return _ranked(self._part('emojis', self._build_emojis)[0], self._rows(selected_user))
+
+    def word_counts(self, selected_user):
+        if self.approximate:
+            return self._estimated_counts('words', selected_user)
+        return _ranked(self._part('words', self._build_words)[2], self._rows(selected_user))
+
+    def top_terms(self, kind, selected_user, limit=None):
+        """
+        (term, count, error) of the most frequent terms of a heavy_hitters.KINDS kind, and the
+        most times any term left out can occur. Counts are exact, with no error, unless the chat
+        is approximate.
+        """
+        summary = self._part(('top', kind), lambda: self._build_top(kind))[0]
+        user = None
+        if selected_user != 'Overall':
+            user = self.users.get_indexer([selected_user])[0]
+            if user == -1:
+                return summary.top(user, 0), 0
+        return summary.top(user, limit), int(summary.floors[summary.n_users if user is None else user])
+
+    def _estimated_counts(self, kind, selected_user):
+        top = self.top_terms(kind, selected_user)[0]
+        return top['count'].set_axis(pd.Index(top['term'].to_numpy(), dtype=object, name='token'))
+
+    def conversations(self, gap_minutes=SESSION_GAP_MINUTES):
+        """
+        Sessions and replies of these messages, with sessions split by gap_minutes of silence
+        """
+        return self._part(('conversations', gap_minutes), lambda: Conversations(
+            self._timestamps(), self._user_codes, self.users, gap_minutes))
+
+    def _timestamps(self):
+        return self._df['Timestamp'].to_numpy()
+
+    def _row_range(self):
+        return 0, len(self._user_codes)
+
+    def search(self, query, selected_user):
+        """
+        Row positions of the messages (of the user) containing every word of query, oldest first
+        """
+        user = None if selected_user == 'Overall' else self.users.get_indexer([selected_user])[0]
+        return self._part('search', self._build_search).find(query, *self._row_range(), user=user)
+
+    def mentions(self, query, selected_user):
+        """
+        Messages containing every word of query sent by each user, and by the user(s) in every
+        month from the first to the last message here
+        """
+        start, stop = self._row_range()
+        counts = self._part('search', self._build_search).counts(query, start, stop)
+        per_user = pd.Series(counts[:len(self.users)].sum(axis=1), index=pd.Index(self.users, name='User'))
+        if start == stop:
+            return per_user, pd.Series(dtype=np.int64)
+        months = np.arange(self._month_codes[0], self._month_codes[-1] + 1)
+        month_num = months % 12 + 1
+        monthly = pd.Series(counts[self._rows(selected_user)][:, months].sum(axis=0), index=pd.MultiIndex.from_arrays([
+            (self._first_year + months // 12).astype(np.int16),
+            month_num.astype(np.int8),
+            pd.Categorical.from_codes(month_num - 1, MONTHS),
+        ], names=['year', 'month_num', 'month']))
+        return per_user, monthly
+
+
+class WindowAggregates(ChatAggregates):
+    """
+    Aggregates of the rows [start, stop) of a store's frame. Per-user counts and the calendar and
+    monthly histograms are cut from the store's prefix sums; links, tokens and emojis are sliced
+    from the store's occurrence tables, which are in row order.
+    """
+
+    def __init__(self, store, start, stop):
+        self._store = store
+        self._start, self._stop = start, stop
+        self._df_ref = store._df_ref
+        self._lock = threading.RLock()
+        self._parts = {}
+        self._part_locks = {}
+        self._part_bytes = {}
+        self._windows = OrderedDict()
+
+        self.users = store.users
+        self._user_codes = store._user_codes[start:stop]
+        self._month_codes = store._month_codes[start:stop]
+        self._first_year = store._first_year
+        self.approximate = store.approximate
+        n_users = len(self.users)
+
+        user_sums = store._part('user_sums', store._build_user_sums).sums(start, stop)
+        self.messages, self.media = user_sums[:, 0], user_sums[:, 1]
+        calendar_sums = store._part('calendar_sums', store._build_calendar_sums)
+        self.calendar = calendar_sums.sums(start, stop).reshape(n_users, 7, 24)
+
+        sums = store._part('monthly_sums', store._build_monthly_sums).sums(start, stop).reshape(n_users, -1, 2)
+        self.monthly = _monthly_series(self.users, sums[:, :, 0], sums[:, :, 1], store._first_year)
+
+    def extended(self, df):
+        raise TypeError("Only a whole chat's aggregates can be extended")
+
+    def window(self, start=None, end=None):
+        raise TypeError("Windows are taken from a whole chat's aggregates")
+
+    def _timestamps(self):
+        return self._df['Timestamp'].to_numpy()[self._start:self._stop]
+
+    def _row_range(self):
+        return self._start, self._stop
+
+    def _occurrences(self, table, column):
+        """
+        Rows of a store occurrence table (sorted by column) that fall in this window, renumbered from 0
+        """
+        first, stop = np.searchsorted(table[column].to_numpy(), [self._start, self._stop])
+        rows = table.iloc[first:stop]
+        return rows.assign(**{column: rows[column] - self._start})
+
+    def _build_links(self):
+        _, _, num_links, links = self._store._part('links', self._store._build_links)
+        return _links_part(self._user_codes, len(self.users), num_links[self._start:self._stop],
+                           self._occurrences(links, 'position'))
+
+    def _build_words(self):
+        _, tokens, _, num_words = self._store._part('words', self._store._build_words)
+        return _words_part(self._user_codes, self.users, num_words[self._start:self._stop],
+                           self._occurrences(tokens, 'message_id')[['message_id', 'token']])
+
+    def _build_emojis(self):
+        _, found = self._store._part('emojis', self._store._build_emojis)
+        return _emojis_part(self._user_codes, self._occurrences(found, 'position'))
+
+    def _build_top(self, kind):
+        # Counted over this window's rows, in the store's mode
+        capacity = TOPK_CAPACITY if self.approximate else None
+        return count_terms(self._df.iloc[self._start:self._stop], kind, self._user_codes, len(self.users), capacity)
+
+    def _build_search(self):
+        # The store's index, searched over this window's rows only
+        return self._store._part('search', self._store._build_search)
+
+
+class PrefixSums:
+    """
+    Per-group totals of per-row weights over any range of rows.
+    Rows are ordered by (group, row) and their weights summed cumulatively in that order,
+    so the total of every group over a range takes two binary searches.
+    """
+
+    def __init__(self, groups, n_groups, weights):
+        n_rows = len(groups)
+        order = np.argsort(groups, kind='stable')
+        self._n_rows = n_rows
+        self._n_groups = n_groups
+        self._keys = np.asarray(groups, dtype=np.int64)[order] * n_rows + order
+        weights = np.asarray(weights, dtype=np.int64).reshape(n_rows, -1)[order]
+        self._cumulative = np.concatenate([np.zeros((1, weights.shape[1]), dtype=np.int64),
+                                           np.cumsum(weights, axis=0)])
+
+    def sums(self, start, stop):
+        """
+        (groups, weights) array of the totals over rows [start, stop)
+        """
+        offsets = np.arange(self._n_groups, dtype=np.int64) * self._n_rows
+        return (self._cumulative[np.searchsorted(self._keys, offsets + stop)]
+                - self._cumulative[np.searchsorted(self._keys, offsets + start)])
+
+
+# ------------------- Store lookup -------------------
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_aggregates(df, window=None):
+    """
+    Returns the aggregate store of a parsed frame, building it on first use, or with a
+    (start, end) window, the aggregates of the messages in that date range.
+    The store is kept while the frame is alive, so the frame must not be modified afterwards.
+    """
+    with _stores_lock:
+        store = _stores.get(id(df))
+    if store is None or store._df is not df:
+        store = _register(df, ChatAggregates(df))
+    return store if window is None else store.window(*window)
+
+
+def extend_aggregates(previous_df, df):
+    """
+    Returns the aggregate store of df, a frame that starts with every row of previous_df.
+    When previous_df already has a store, only the rows after it are aggregated.
+    """
+    with _stores_lock:
+        store = _stores.get(id(previous_df))
+    if store is None or store._df is not previous_df:
+        return get_aggregates(df)
+    return _register(df, store.extended(df))
+
+
+def stored_bytes(df):
+    """
+    Estimated bytes of the aggregates built from df so far, which live as long as df does
+    """
+    with _stores_lock:
+        store = _stores.get(id(df))
+    return 0 if store is None or store._df is not df else store.nbytes()
+
+
+def _register(df, store):
+    key = id(df)
+    with _stores_lock:
+        _stores[key] = store
+    weakref.finalize(df, _stores.pop, key, None)
+    return store
+
+
+# ------------------- Parts -------------------
+def _monthly_series(users, rows, messages, first_year):
+    """
+    Messages per (User, year, month_num, month) from (users, months) histograms of rows and messages,
+    for the months each user has rows in
+    """
+    user, month = np.nonzero(rows)
+    month_num = month % 12 + 1
+    return pd.Series(messages[user, month], name='Message', index=pd.MultiIndex.from_arrays([
+        pd.Categorical.from_codes(user, users),
+        (first_year + month // 12).astype(np.int16),
+        month_num.astype(np.int8),
+        pd.Categorical.from_codes(month_num - 1, MONTHS),
+    ], names=['User', 'year', 'month_num', 'month']))
+
+
+def _links_part(user_codes, n_users, num_links, links):
+    per_user = np.bincount(user_codes, weights=num_links, minlength=n_users).astype(np.int64)
+    domains = (
+        pd.DataFrame({'user': user_codes[links['position'].to_numpy()], 'domain': links['domain'].to_numpy()})
+        .value_counts()
+        .rename('count')
+        .reset_index()
+    )
+    return per_user, domains, num_links, links
+
+
+def _words_part(user_codes, users, num_words, tokens):
+    per_user = np.bincount(user_codes, weights=num_words, minlength=len(users)).astype(np.int64)
+    token_users = user_codes[tokens['message_id'].to_numpy()]
+    tokens.insert(1, 'user', pd.Categorical.from_codes(token_users, users))
+    return per_user, tokens, _count_tokens(token_users, tokens['token']), num_words
+
+
+def _emojis_part(user_codes, found):
+    return _count_tokens(user_codes[found['position'].to_numpy()], found['emoji']), found
+
+
+# ------------------- Token tables -------------------
+def _count_tokens(user_codes, tokens):
+    """
+    Counts tokens per user from per-occurrence user codes and tokens in order of appearance,
+    remembering the position of each token's first occurrence so ties keep the order
+    Counter.most_common() would give them.
+    """
+    occurrences = pd.DataFrame({'user': user_codes.astype(np.int64), 'token': pd.Categorical(tokens),
+                                'first': np.arange(len(user_codes), dtype=np.int64)})
+    table = occurrences.groupby(['user', 'token'], sort=False, observed=True).agg(
+        count=('first', 'size'), first=('first', 'min'))
+    return table.reset_index()[['user', 'token', 'count', 'first']]
+
+
+def _merge_counts(*parts):
+    """
+    Adds up token count tables given as (user code map, table, offset of its first occurrence)
+    """
+    tables = [table.assign(user=user_map[table['user'].to_numpy()], first=table['first'] + offset)
+              for user_map, table, offset in parts]
+    merged = _concat(tables, ignore_index=True)
+    merged['token'] = union_categoricals([table['token'] for table in tables])
+    table = merged.groupby(['user', 'token'], sort=False, observed=True).agg(
+        count=('count', 'sum'), first=('first', 'min'))
+    return table.reset_index()[['user', 'token', 'count', 'first']]
+
+
+def _concat(frames, **options):
+    # Empty frames would decide nothing but still trigger pandas' all-NA concat warning
+    return pd.concat([frame for frame in frames if len(frame)] or frames[:1], **options)
+
+
+def _select(table, rows):
+    """
+    Rows of a table with a 'user' code column that belong to a slice of users
+    """
+    if rows == slice(None):
+        return table
+    return table[(table['user'] >= rows.start) & (table['user'] < rows.stop)]
+
+
+def _ranked(table, rows):
+    """
+    Token counts for a slice of users, most common first
+    """
+    merged = _select(table, rows).groupby('token', sort=False, observed=True).agg(
+        count=('count', 'sum'), first=('first', 'min'))
+    merged = merged.sort_values(['count', 'first'], ascending=[False, True])
+    return merged['count'].set_axis(merged.index.astype(object))
@@ -1,17 +1,302 @@
-from io import StringIO
-from wordcloud import WordCloud
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 import preprocessor
+from aggregates import extend_aggregates, stored_bytes
 import pandas as pd
 import streamlit as st
 import helper
-import matplotlib.pyplot as plt
-import seaborn as sns
 import guide
+import cache
+import charts
+from conversations import SESSION_GAP_MINUTES
+import logging
+import profiling
+import tokens
+import uploads
 
 st.set_page_config(layout="wide")
 
+# Sidebar periods, in days back from the last message
+PERIODS = {"All time": None, "Last 7 days": 7, "Last 30 days": 30, "Last 90 days": 90, "Last 365 days": 365,
+           "Custom range": None}
+# Threads computing the sections of a page while the ones before them are drawn
+SECTION_WORKERS = int(os.environ.get('CHAT_SECTION_WORKERS', 4))
+
+# Stage timings go to the server log as one JSON object per line
+logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s %(message)s')
+logging.getLogger(profiling.__name__).setLevel(logging.INFO)
+# Collects the stages of this run for the sidebar Performance panel
+profiler = profiling.Profiler()
+
+
+@st.cache_resource
+def get_result_cache():
+    # One cache per server process, shared by every session and rerun
+    return cache.LRUCache()
+
+
+@st.cache_resource
+def get_disk_cache():
+    return cache.DiskCache()
+
+
+@st.cache_resource
+def get_export_index():
+    return cache.ExportIndex()
+
+
+@st.cache_resource
+def get_parse_pool():
+    # Worker processes start on first use and are kept for later uploads
+    return uploads.process_pool()
+
+
+@st.cache_resource
+def get_section_pool():
+    # One pool per server process; sessions share it, so a busy server doesn't multiply threads
+    return ThreadPoolExecutor(max_workers=SECTION_WORKERS, thread_name_prefix='section')
+
+
+result_cache = get_result_cache()
+disk_cache = get_disk_cache()
+export_index = get_export_index()
+
+
+def cached(chat_hash, func, selected_user, df, window=None, **options):
+    """
+    Runs a helper once per (chat content, user, function, date window, options) and reuses the result on later reruns
+    """
+    key = (chat_hash, selected_user, func.__name__, window) + tuple(sorted(options.items()))
+    with profiler.stage(f'helper.{func.__name__}', rows=len(df)) as record:
+        record['cached'] = key in result_cache
+        result = result_cache.get_or_compute(key, func, selected_user, df, window, **options)
+    if not record['cached']:
+        count_aggregates(chat_hash, df)
+    return result
+
+
+def count_aggregates(chat_hash, df):
+    """
+    Charges the aggregates built from a chat to its frame's cache entry: they live exactly as long as
+    the frame, so the cache's size limit has to count them and evicting the frame frees them
+    """
+    result_cache.attach((chat_hash, None, "preprocess"), stored_bytes(df))
+
+
+def show_chart(chat_hash, name, selected_user, window, draw, *args):
+    """
+    Draws a chart once per (chat content, user, chart, date window) and shows the cached image on later reruns
+    """
+    key = (chat_hash, selected_user, f'chart.{name}', window)
+    with profiler.stage(f'chart.{name}') as record:
+        record['cached'] = key in result_cache
+        image = result_cache.get_or_compute(key, lambda: charts.render(draw(*args)))
+        st.image(image, width="stretch")
+
+
+def wordcloud_image(chat_hash, selected_user, window, frequencies, preview=False):
+    """
+    The word cloud as PNG bytes, laid out once per (chat content, user, date window, size).
+    Full-size clouds are also kept on disk, so a restart or another worker never lays one out again.
+    """
+    stage = 'chart.wordcloud.preview' if preview else 'chart.wordcloud'
+    key = (chat_hash, selected_user, stage, window)
+
+    def draw():
+        # Besides the chat, the cloud depends on the parser and the stopwords left out
+        name = cache.content_hash(repr((chat_hash, selected_user, window, preprocessor.PARSER_VERSION,
+                                        tokens.STOPWORD_LANGUAGES)).encode())
+        image = None if preview else disk_cache.load_image(name)
+        if image is None:
+            image = charts.wordcloud_image(helper.layout_wordcloud(frequencies, preview))
+            if not preview:
+                try:
+                    disk_cache.save_image(name, image)
+                except OSError:
+                    pass
+        return image
+
+    with profiler.stage(stage) as record:
+        record['cached'] = key in result_cache
+        return result_cache.get_or_compute(key, draw)
+
+
+def prefetch(func, *args, **kwargs):
+    """
+    Starts func in the section pool. Only computes results; everything shown is drawn by the script thread.
+    """
+    return get_section_pool().submit(func, *args, **kwargs)
+
+
+def wait_for(future, message="Crunching the numbers..."):
+    """
+    Result of a prefetched section, with a spinner in its place while it is still being computed
+    """
+    if future.done():
+        return future.result()
+    with st.spinner(message):
+        return future.result()
+
+
+def draw_ready(deferred, wait=False):
+    """
+    Draws the (future, draw) parts whose results are in, or all of them with wait, and drops them from deferred
+    """
+    for future, draw in list(deferred):
+        if wait or future.done():
+            draw(future.result())
+            deferred.remove((future, draw))
+
+
+def busy_users(chat_hash, df, window):
+    with profiler.stage('helper.most_busy_users', rows=len(df)) as record:
+        key = (chat_hash, "Overall", "most_busy_users", window)
+        record['cached'] = key in result_cache
+        result = result_cache.get_or_compute(key, helper.most_busy_users, df, window)
+    if not record['cached']:
+        count_aggregates(chat_hash, df)
+    return result
+
+
+def show_performance():
+    if profiler.records:
+        with st.sidebar.expander("⏱️ Performance"):
+            st.caption("Time, rows and memory change of every stage in this run, slowest first. "
+                       "Cached stages were served from an earlier run. Memory is the whole process's, "
+                       "so it is left out for sections computed in the background.")
+            st.dataframe(profiler.table(), width="stretch", hide_index=True)
+
+
+def parse_chat(bytes_data):
+    # Decoded while it is parsed, the whole export never exists as one string
+    with profiler.stage('preprocessor.preprocess', bytes=len(bytes_data)) as record:
+        df = uploads.parse_export(bytes_data)
+        record['rows'] = len(df)
+    return df
+
+
+def load_chat(bytes_data):
+    """
+    Parses an upload. When it is a newer export of a chat parsed before, only the messages after
+    the previous export are parsed, and the previous aggregates are extended with them.
+    """
+    previous = export_index.find_previous(bytes_data)
+    if previous is not None:
+        previous_hash, length = previous
+        previous_df = result_cache.get((previous_hash, None, "preprocess"))
+        if previous_df is None:
+            previous_df = disk_cache.load(previous_hash)
+        if previous_df is not None:
+            try:
+                with profiler.stage('preprocessor.preprocess_tail', bytes=len(bytes_data) - length) as record:
+                    # The tail alone may not tell day from month, the start of the export does
+                    head = uploads.open_text(io.BytesIO(bytes_data)).read(preprocessor.SNIFF_CHARS)
+                    tail = uploads.open_text(io.BytesIO(bytes_data), start=length).read()
+                    df = preprocessor.preprocess_tail(previous_df, tail, preprocessor.sniff_format(head))
+                    record['rows'] = len(df) - len(previous_df)
+            except ValueError:
+                # Edited history or a cut in the middle of a message, parse the whole export
+                pass
+            else:
+                with profiler.stage('aggregates.extend_aggregates', rows=len(df) - len(previous_df)):
+                    extend_aggregates(previous_df, df)
+                return df
+    return parse_chat(bytes_data)
+
+
+def merge_exports(exports):
+    """
+    Parses several exports in parallel and merges them into one chat without the messages they share
+    """
+    with profiler.stage('uploads.parse_exports', bytes=sum(len(data) for _, data in exports)) as record:
+        frames = uploads.parse_exports([data for _, data in exports], get_parse_pool())
+        record['rows'] = sum(len(frame) for frame in frames)
+    with profiler.stage('preprocessor.merge_chats', rows=record['rows']) as record:
+        df = preprocessor.merge_chats(frames)
+        record['duplicates'] = record['rows'] - len(df)
+    return df
+
+
+# ------------------- Sections -------------------
+@st.fragment
+def conversations_section(chat_hash, display_user, df, window):
+    """
+    A fragment: changing the idle gap reruns only this section
+    """
+    st.markdown("---")
+    st.title("Conversations")
+    gap = st.number_input("Idle gap (minutes)", min_value=1, max_value=24 * 60, value=SESSION_GAP_MINUTES,
+                          step=5, help="A silence longer than this ends a conversation")
+
+    sessions = cached(chat_hash, helper.conversation_sessions, display_user, df, window, gap=gap)
+    response_df = cached(chat_hash, helper.response_times, display_user, df, window, gap=gap)
+
+    if sessions.empty:
+        st.write("No conversations found!")
+    else:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric(label="Conversations", value=len(sessions))
+        with col2:
+            st.metric(label="Median Length", value=f"{sessions['Minutes'].median():.0f} min")
+        with col3:
+            st.metric(label="Median Messages", value=f"{sessions['Messages'].median():.0f}")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.subheader("Conversation Lengths")
+            show_chart(chat_hash, f'session_lengths.{gap}', display_user, window, charts.session_lengths_chart,
+                       sessions)
+        with col2:
+            st.subheader("Reply Times (minutes)")
+            st.dataframe(response_df, width="stretch")
+
+        matrix = cached(chat_hash, helper.reply_matrix, display_user, df, window, gap=gap)
+        if display_user == "Overall" and not matrix.empty:
+            st.subheader("Who Replies to Whom")
+            show_chart(chat_hash, f'reply_matrix.{gap}', display_user, window, charts.reply_matrix_chart, matrix)
+        elif not matrix.empty:
+            st.subheader(f"Replies Sent and Received by {display_user}")
+            st.dataframe(matrix, width="stretch")
+
+
+@st.fragment
+def keyword_search_section(chat_hash, display_user, df, window):
+    """
+    A fragment: a new search reruns only this section
+    """
+    st.markdown("---")
+    st.title("Keyword Search")
+    query = st.text_input("Search messages", placeholder="Words to look for, e.g. birthday party",
+                          help="Finds the messages containing every one of the words, in any case").strip()
+
+    if query:
+        found, results = cached(chat_hash, helper.search_messages, display_user, df, window, query=query)
+        if found == 0:
+            st.write(f"No messages mention \"{query}\"!")
+        else:
+            timeline = cached(chat_hash, helper.keyword_timeline, display_user, df, window, query=query)
+            mentions = cached(chat_hash, helper.keyword_users, display_user, df, window, query=query)
+
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric(label="Messages Found", value=found)
+            with col2:
+                st.metric(label="Top Mentioner", value=mentions['User'].iloc[0])
+
+            show_chart(chat_hash, f'keyword_timeline.{query}', display_user, window,
+                       charts.keyword_timeline_chart, timeline, query)
+
+            col1, col2 = st.columns([1, 2])
+            with col1:
+                st.subheader("Mentions by User")
+                st.dataframe(mentions, width="stretch", hide_index=True)
+            with col2:
+                st.subheader("Latest Messages" if found <= len(results) else f"Latest {len(results)} Messages")
+                st.dataframe(results, width="stretch", hide_index=True)
 
-from helper import most_common_words
 
 st.markdown("""
     <style>
@@ -31,11 +316,12 @@ st.sidebar.markdown(
     unsafe_allow_html=True
 )
 
-uploaded_file = st.sidebar.file_uploader(
+uploaded_files = st.sidebar.file_uploader(
     "📂 Choose a WhatsApp chat file",
-    type=["txt"],
-    accept_multiple_files=False,
-    help="Upload your exported WhatsApp chat (.txt file)",
+    type=["txt", "zip"],
+    accept_multiple_files=True,
+    help="Upload your exported WhatsApp chat (.txt file, or .zip when exported with media). "
+         "Several overlapping exports of the same chat are merged.",
     label_visibility="visible"
 )
 
@@ -44,18 +330,38 @@ if 'analyzed_user' not in st.session_state:
     st.session_state.analyzed_user = None
 
 # Reset analysis when a new file is uploaded
-if uploaded_file is not None:
-    file_id = uploaded_file.file_id
+if uploaded_files:
+    file_id = tuple(uploaded_file.file_id for uploaded_file in uploaded_files)
     if 'current_file_id' not in st.session_state or st.session_state.current_file_id != file_id:
         st.session_state.current_file_id = file_id
         st.session_state.analyzed_user = None
 
-if uploaded_file is not None:
-    bytes_data = uploaded_file.getvalue()
-    data = bytes_data.decode("utf-8")
-
+if uploaded_files:
     try:
-        df = preprocessor.preprocess(data)
+        with profiler.stage('uploads.read_exports', files=len(uploaded_files)) as record:
+            exports = uploads.read_exports((f.name, f.getvalue()) for f in uploaded_files)
+            record['bytes'] = sum(len(data) for _, data in exports)
+
+        if len(exports) == 1:
+            bytes_data = exports[0][1]
+            chat_hash = cache.content_hash(bytes_data)
+            parse = lambda: load_chat(bytes_data)
+        else:
+            # The same exports in any order are the same chat
+            chat_hash = cache.content_hash(' '.join(sorted(cache.content_hash(data) for _, data in exports)).encode())
+            parse = lambda: merge_exports(exports)
+        profiler.context['chat'] = chat_hash
+
+        with profiler.stage('load_chat', bytes=record['bytes']) as record:
+            record['cached'] = (chat_hash, None, "preprocess") in result_cache
+            df = result_cache.get_or_compute(
+                (chat_hash, None, "preprocess"),
+                lambda: disk_cache.get_or_parse(chat_hash, parse))
+            record['rows'] = len(df)
+        # A newer export extends the previous one's aggregates while it is loaded
+        count_aggregates(chat_hash, df)
+        if len(exports) == 1:
+            export_index.add(chat_hash, bytes_data)
 
         # Check if dataframe is empty or doesn't have required columns
         if df.empty or 'User' not in df.columns or 'Message' not in df.columns:
@@ -65,7 +371,7 @@ if uploaded_file is not None:
             st.stop()
 
         # fetching unique user
-        user_list = df["User"].unique().tolist()
+        user_list = [user for user in df["User"].unique().tolist() if user != preprocessor.NOTIFICATION_USER]
         user_list.sort()
         user_list.insert(0, "Overall")
 
@@ -77,6 +383,26 @@ if uploaded_file is not None:
 
     selected_user = st.sidebar.selectbox("Show analysis wrt", user_list)
 
+    # ------------------- Period -------------------
+    first_day, last_day = df['Timestamp'].iloc[0].date(), df['Timestamp'].iloc[-1].date()
+    period = st.sidebar.selectbox("Period", list(PERIODS),
+                                  help="Relative periods end on the day of the last message in the chat")
+    if period == "Custom range":
+        picked = st.sidebar.date_input("Date range", value=(first_day, last_day),
+                                       min_value=first_day, max_value=last_day)
+        picked = tuple(picked) if isinstance(picked, (tuple, list)) else (picked,)
+        # The picker returns a single date while the second one is being chosen
+        start_day, end_day = (picked * 2)[:2] if picked else (first_day, last_day)
+    elif PERIODS[period] is None:
+        start_day, end_day = first_day, last_day
+    else:
+        start_day, end_day = last_day - timedelta(days=PERIODS[period] - 1), last_day
+
+    # Helpers take the window as [start, end) timestamps, None analyzes the whole chat
+    window = None
+    if start_day > first_day or end_day < last_day:
+        window = (pd.Timestamp(start_day), pd.Timestamp(end_day) + pd.Timedelta(days=1))
+
     # Button is always visible when file is uploaded
     if st.sidebar.button("Show analysis"):
         st.session_state.analyzed_user = selected_user
@@ -90,8 +416,32 @@ if uploaded_file is not None:
         st.markdown(
             f"<h1> Top Statistics: <span style='color: #25D366; font-weight: bold; font-size: 1.1em;'>{display_user}</span></h1>",
             unsafe_allow_html=True)
+        if window is not None:
+            st.caption(f"📅 {start_day:%d %b %Y} – {end_day:%d %b %Y}")
+
+        # Counted when the chat was loaded, so they show before anything else is computed
+        num_messages, num_media = cached(chat_hash, helper.message_counts, display_user, df, window)
+        if num_messages == 0:
+            # Nothing to chart or count, for the whole chat or just this user
+            st.info("No messages in the selected period.")
+            show_performance()
+            st.stop()
 
-        num_messages, num_words, num_media, num_links = helper.fetch_stats(display_user, df)
+        # Every slower section starts computing now, in page order, and is drawn when the page reaches it
+        stats = prefetch(cached, chat_hash, helper.fetch_stats, display_user, df, window)
+        busy = prefetch(busy_users, chat_hash, df, window) if display_user == "Overall" else None
+        timeline = prefetch(cached, chat_hash, helper.monthly_timeline, display_user, df, window)
+        weekdays = prefetch(cached, chat_hash, helper.most_active_weekdays, display_user, df, window)
+        months = prefetch(cached, chat_hash, helper.most_active_months, display_user, df, window)
+        cloud_words = prefetch(cached, chat_hash, helper.wordcloud_frequencies, display_user, df, window)
+        # Queued after the words it waits for, so it never holds a worker they need
+        cloud = prefetch(lambda: cloud_words.result() and wordcloud_image(chat_hash, display_user, window,
+                                                                          cloud_words.result()))
+        common_words = prefetch(cached, chat_hash, helper.most_common_words, display_user, df, window)
+        phrases = {kind: prefetch(cached, chat_hash, helper.common_phrases, display_user, df, window, kind=kind)
+                   for kind in ('bigrams', 'trigrams')}
+        emojis = prefetch(cached, chat_hash, helper.emoji_helper, display_user, df, window)
+        heatmap = prefetch(cached, chat_hash, helper.activity_heatmap_normalized, display_user, df, window)
 
         col1, col2, col3, col4 = st.columns(4)
 
@@ -99,21 +449,36 @@ if uploaded_file is not None:
             st.metric(label="Total Messages", value=num_messages)
 
         with col2:
-            st.metric(label="Total Words", value=num_words)
+            words_slot = st.empty()
+            words_slot.metric(label="Total Words", value="…")
 
         with col3:
             st.metric(label="Media Shared", value=num_media)
 
         with col4:
-            st.metric(label="Links Shared", value=num_links)
+            links_slot = st.empty()
+            links_slot.metric(label="Links Shared", value="…")
+
+        domains_slot = st.empty()
+
+        def draw_stats(result):
+            # Words and links need every message tokenized and scanned for URLs, they fill in once done
+            _, num_words, _, num_links = result
+            words_slot.metric(label="Total Words", value=num_words)
+            links_slot.metric(label="Links Shared", value=num_links)
+            if num_links:
+                with domains_slot.container(), st.expander("Links by domain"):
+                    domains_df = cached(chat_hash, helper.link_domains, display_user, df, window)
+                    st.dataframe(domains_df, width="stretch", hide_index=True)
+
+        deferred = [(stats, draw_stats)]
 
         # Finding the busiest user in the group(Only for Overall)
         if display_user == "Overall":
             st.markdown("---")
             st.title("Most Busy Users")
 
-            x, new_df = helper.most_busy_users(df)
-
+            x, new_df = wait_for(busy)
             # Calculate dynamic height based on number of users
             num_users = len(new_df)
             row_height = 35  # pixels per row
@@ -123,15 +488,8 @@ if uploaded_file is not None:
             col1, col2 = st.columns(2)
 
             with col1:
-                # Calculate figure height to match dataframe
-                fig_height = dynamic_height / 72  # Convert pixels to inches (72 DPI)
-                fig, ax = plt.subplots(figsize=(5, fig_height))
-                ax.bar(x.index, x.values, color='steelblue')
-                plt.xticks(rotation=45, ha='right')
-                ax.set_xlabel('Users')
-                ax.set_ylabel('No. of Messages')
-                plt.tight_layout()
-                st.pyplot(fig)
+                show_chart(chat_hash, 'most_busy_users', display_user, window, charts.busy_users_chart,
+                           x, dynamic_height)
 
             with col2:
                 # Format the percentage values to include % sign
@@ -140,161 +498,121 @@ if uploaded_file is not None:
                 new_df_display['Percentage'] = new_df_display['Percentage'].apply(lambda x: f"{x}%")
                 # Reset index to start from 1
                 new_df_display.index = range(1, len(new_df_display) + 1)
-                st.dataframe(new_df_display, height=dynamic_height, use_container_width=True)
+                st.dataframe(new_df_display, height=dynamic_height, width="stretch")
+
+        draw_ready(deferred)
 
         # Timeline Analysis
         st.markdown("---")
         st.title(" Message Timeline")
 
         # Monthly Timeline - USE display_user
-        timeline = helper.monthly_timeline(display_user, df)
-
-        fig, ax = plt.subplots(figsize=(12, 6))
-        ax.plot(timeline["time"], timeline["Message"], marker='o', linewidth=2, markersize=6, color='#4ECDC4')
-
-        # Fill area under the line
-        ax.fill_between(timeline["time"], timeline["Message"], alpha=0.3, color='#4ECDC4')
-
-        # Styling
-        ax.set_xlabel('Month', fontsize=14, fontweight='bold')
-        ax.set_ylabel('Number of Messages', fontsize=14, fontweight='bold')
-        ax.set_title('Message Activity Over Time', fontsize=16, fontweight='bold', pad=20)
-
-        # Rotate x-axis labels
-        plt.xticks(rotation=45, ha='right', fontsize=10)
-        plt.yticks(fontsize=10)
-
-        # Add grid for better readability
-        ax.grid(True, alpha=0.3, linestyle='--')
-
-        # Add background color
-        ax.set_facecolor('#f8f9fa')
-        fig.patch.set_facecolor('white')
+        timeline = wait_for(timeline)
 
-        # Tight layout to prevent label cutoff
-        plt.tight_layout()
+        show_chart(chat_hash, 'timeline', display_user, window, charts.timeline_chart, timeline)
 
-        st.pyplot(fig)
+        weekday_counts = wait_for(weekdays)
+        weekday_counts = weekday_counts.set_axis(weekday_counts.index.str[:3])  # Mon, Tue, Wed...
+        month_counts = wait_for(months)
+        # Both charts share the y scale
+        y_max = max(weekday_counts.max(), month_counts.max() if len(month_counts) else 0, 1) * 1.1
 
         col1, col2 = st.columns(2)
 
         # ------------------- Most Active Weekday -------------------
         with col1:
             st.subheader(" Most Active Weekday")
-            weekday_counts = helper.most_active_weekdays(display_user, df)
-            weekday_counts.index = weekday_counts.index.str[:3]  # Mon, Tue, Wed...
-
-            fig, ax = plt.subplots()
-            ax.bar(weekday_counts.index, weekday_counts.values, color='skyblue')
-            for i, v in enumerate(weekday_counts.values):
-                ax.text(i, v + 0.5, str(v), ha='center', va='bottom', fontsize=9)
-
-            ax.set_ylim(0,
-                        max(weekday_counts.values.max(),
-                            helper.most_active_months(display_user, df).values.max()) * 1.1)
-            ax.set_xlabel("Day of the Week")
-            ax.set_ylabel("Number of Messages")
-            ax.set_title("Messages per Weekday", fontsize=12, fontweight='bold')
-            ax.grid(axis='y', linestyle='--', alpha=0.3)
-
-            # Stretch to fill the column
-            fig.tight_layout(pad=1.0)
-            st.pyplot(fig, use_container_width=True)
+
+            show_chart(chat_hash, 'most_active_weekdays', display_user, window, charts.weekday_chart,
+                       weekday_counts, y_max)
 
         # ------------------- Most Active Month -------------------
         with col2:
             st.subheader(" Most Active Month")
-            month_counts = helper.most_active_months(display_user, df)
-            month_counts_sorted = month_counts[::-1]
-
-            fig, ax = plt.subplots()
-            ax.bar(month_counts_sorted.index, month_counts_sorted.values, color='orange')
-            for i, v in enumerate(month_counts_sorted.values):
-                ax.text(i, v + 0.5, str(v), ha='center', va='bottom', fontsize=9)
-
-            ax.set_ylim(0, max(weekday_counts.values.max(), month_counts_sorted.values.max()) * 1.1)
-            ax.set_xlabel("Month")
-            ax.set_ylabel("Number of Messages")
-            ax.set_title("Messages per Month", fontsize=12, fontweight='bold')
-            plt.xticks(rotation=45)
-            ax.grid(axis='y', linestyle='--', alpha=0.3)
+            show_chart(chat_hash, 'most_active_months', display_user, window, charts.month_chart,
+                       month_counts, y_max)
 
-            # Stretch to fill the column
-            fig.tight_layout(pad=1.0)
-            st.pyplot(fig, use_container_width=True)
+        draw_ready(deferred)
 
         # word cloud
         st.markdown("---")
         st.title("Word Cloud")
-        # Cache the wordcloud to prevent regeneration on sidebar changes
-        df_wc = helper.create_wordcloud(display_user, df.copy())
-        if df_wc is not None:
-            fig, ax = plt.subplots()
-            ax.imshow(df_wc)
-            ax.axis("off")
-            st.pyplot(fig)
-        else:
+        frequencies = wait_for(cloud_words)
+        if not frequencies:
             st.write("No words available to generate word cloud!")
+        elif cloud.done():
+            st.image(cloud.result(), width="stretch")
+        else:
+            # A quick preview holds the place of the full-size cloud, which replaces it once laid out
+            cloud_slot = st.empty()
+            cloud_slot.image(wordcloud_image(chat_hash, display_user, window, frequencies, preview=True),
+                             width="stretch")
+            deferred.append((cloud, lambda image: cloud_slot.image(image, width="stretch")))
 
         # Most_Common_Words - USE display_user
         st.title("Most Common Words")
-        most_common_df = helper.most_common_words(display_user, df)
+        most_common_df = wait_for(common_words)
 
         if not most_common_df.empty:
-            fig, ax = plt.subplots(figsize=(10, 8))
-            bars = ax.barh(most_common_df[0], most_common_df[1], color='skyblue')
-
-            # Add the exact numbers at the end of each bar
-            for i, (word, count) in enumerate(zip(most_common_df[0], most_common_df[1])):
-                ax.text(count, i, f' {count}', va='center', fontsize=10)
-
-            ax.set_xlabel('Count', fontsize=12)
-            ax.set_ylabel('Words', fontsize=12)
-            ax.set_title('Most Common Words', fontsize=14)
-            ax.invert_yaxis()
-
-            st.pyplot(fig)
+            show_chart(chat_hash, 'most_common_words', display_user, window, charts.common_words_chart,
+                       most_common_df)
         else:
             st.write("No common words found!")
 
+        # ------------------- Common Phrases -------------------
+        st.title("Common Phrases")
+        col1, col2 = st.columns(2)
+        for col, kind, label in [(col1, 'bigrams', "Two Words"), (col2, 'trigrams', "Three Words")]:
+            with col:
+                st.subheader(label)
+                phrases_df = wait_for(phrases[kind])
+                if phrases_df.empty:
+                    st.write("No common phrases found!")
+                elif phrases_df['Error'].any():
+                    st.caption("Counted approximately on this large chat: "
+                               "each count is at most Error above the true one.")
+                    st.dataframe(phrases_df, width="stretch", hide_index=True)
+                else:
+                    st.dataframe(phrases_df.drop(columns='Error'), width="stretch", hide_index=True)
+
         # Emoji Analysis
         st.title("Emoji Analysis")
-        emoji_df = helper.emoji_helper(display_user, df)
+        emoji_df = wait_for(emojis)
 
         if not emoji_df.empty:
-            styled_df = emoji_df.style \
-                .background_gradient(subset=['Count'], cmap='YlOrRd') \
-                .background_gradient(subset=['Percentage'], cmap='Greens') \
-                .set_properties(subset=['Count', 'Percentage'], **{
-                'font-weight': 'bold',
-                'font-size': '30px',
-                'text-align': 'center'
-            }) \
-                .set_properties(subset=['Emoji'], **{
-                'font-size': '30px',
-                'text-align': 'center'
-            }) \
-                .format({'Percentage': '{:.2f}%'})
-
-            st.dataframe(styled_df, use_container_width=True, hide_index=True)
+            with profiler.stage('table.emojis'):
+                styled_df = emoji_df.style \
+                    .background_gradient(subset=['Count'], cmap='YlOrRd') \
+                    .background_gradient(subset=['Percentage'], cmap='Greens') \
+                    .set_properties(subset=['Count', 'Percentage'], **{
+                    'font-weight': 'bold',
+                    'font-size': '30px',
+                    'text-align': 'center'
+                }) \
+                    .set_properties(subset=['Emoji'], **{
+                    'font-size': '30px',
+                    'text-align': 'center'
+                }) \
+                    .format({'Percentage': '{:.2f}%'})
+
+                st.dataframe(styled_df, width="stretch", hide_index=True)
         else:
             st.write("No emojis found in the chat!")
 
+        draw_ready(deferred)
+
         st.markdown("---")
         st.title(f" {display_user}'s Most Active Times")
 
         # Heatmap - USE display_user
-        heatmap_data = helper.activity_heatmap_normalized(display_user, df)
+        heatmap_data = wait_for(heatmap)
 
-        fig, ax = plt.subplots(figsize=(12, 6))
-        sns.heatmap(heatmap_data, cmap="YlGnBu", linewidths=.5, cbar=True, ax=ax,
-                    yticklabels=True, xticklabels=True)
+        show_chart(chat_hash, 'heatmap', display_user, window, charts.heatmap_chart, heatmap_data, display_user)
 
-        ax.set_xlabel("Hour of Day")
-        ax.set_ylabel("Weekday")
-        ax.set_title(f"Most Active Times for {display_user}")
+        draw_ready(deferred, wait=True)
 
-        st.pyplot(fig, use_container_width=True)
+        conversations_section(chat_hash, display_user, df, window)
+        keyword_search_section(chat_hash, display_user, df, window)
         st.markdown("---")
 
     else:
@@ -303,4 +621,7 @@ if uploaded_file is not None:
 
 else:
     # Show tutorial when no file is uploaded
-    guide.show_guide()
\ No newline at end of file
+    guide.show_guide()
+
+# ------------------- Performance -------------------
+show_performance()
@@ -0,0 +1,129 @@
+"""
+Scaling benchmarks for the parser and every helper, on synthetic chats.
+
+    python benchmark.py --messages 10000,100000 --save-baseline bench.json
+    python benchmark.py --messages 10000,100000 --baseline bench.json
+
+Each stage is timed on its own (best of --repeat runs) and run once more under tracemalloc for
+its peak memory. Helpers get a fresh copy of the frame, so each one pays for the aggregates it needs.
+With --baseline the run fails when a stage is slower or bigger than the baseline by more than --tolerance.
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import helper
+import preprocessor
+import synthetic
+
+# Timed runs per stage by default: a single run is too noisy to compare against a baseline
+REPEAT = 5
+# Stages faster than this (seconds) or smaller (MB) in the baseline are compared against it instead
+FLOORS = {'seconds': 0.05, 'peak_mb': 1.0}
+
+HELPERS = ['fetch_stats', 'link_domains', 'monthly_timeline', 'most_active_weekdays', 'most_active_months',
+           'activity_heatmap_normalized', 'most_common_words', 'emoji_helper', 'create_wordcloud',
+           'conversation_sessions', 'response_times', 'reply_matrix', 'search_messages', 'keyword_users',
+           'keyword_timeline', 'common_phrases']
+# Options of the helpers that need more than a user, such as a search query
+QUERY = {'query': 'project deadline'}
+HELPER_OPTIONS = {'search_messages': QUERY, 'keyword_users': QUERY, 'keyword_timeline': QUERY}
+
+
+def measure(func, repeat=1):
+    """
+    Returns (best wall time in seconds, peak traced memory in MB) of func()
+    """
+    seconds = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        seconds = min(seconds, time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak / 2 ** 20
+
+
+def run_size(messages, users, repeat, workdir):
+    path = synthetic.write_chat(Path(workdir) / f'chat-{messages}.txt', messages=messages, users=users)
+    results = {}
+
+    def record(stage, func):
+        seconds, peak_mb = measure(func, repeat)
+        results[stage] = {'seconds': round(seconds, 4), 'peak_mb': round(peak_mb, 2)}
+        print(f'{messages:>10} {stage:<45} {seconds:9.3f}s {peak_mb:10.1f} MB', flush=True)
+
+    record('read+decode', lambda: Path(path).read_bytes().decode('utf-8'))
+    data = Path(path).read_text(encoding='utf-8')
+    record('preprocess', lambda: preprocessor.preprocess(data))
+
+    df = preprocessor.preprocess(data)
+    # Only the frame is needed from here on
+    data = None
+    single_user = df['User'].value_counts().index[0]
+    for name in HELPERS:
+        for selected_user in ("Overall", single_user):
+            label = 'Overall' if selected_user == "Overall" else 'user'
+            # A new frame object gets a new aggregate store, so nothing is reused between runs
+            record(f'{name}[{label}]', lambda: getattr(helper, name)(selected_user, df.copy(deep=False),
+                                                                     **HELPER_OPTIONS.get(name, {})))
+    record('most_busy_users[Overall]', lambda: helper.most_busy_users(df))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the stages that got slower or bigger than baseline by more than tolerance (a ratio)
+    """
+    regressions = []
+    for size, stages in results.items():
+        for stage, current in stages.items():
+            previous = baseline.get(size, {}).get(stage)
+            if previous is None:
+                continue
+            for metric, floor in FLOORS.items():
+                # Ignore noise on stages too small to matter
+                if current[metric] > max(previous[metric], floor) * tolerance:
+                    regressions.append(f'{size} {stage} {metric}: {previous[metric]} -> {current[metric]}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark preprocess and every helper on synthetic chats.")
+    parser.add_argument('--messages', default='10000,100000',
+                        help="comma-separated chat sizes (messages) to benchmark")
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=REPEAT, help="timed runs per stage, the best one is kept")
+    parser.add_argument('--baseline', help="JSON results to compare against")
+    parser.add_argument('--tolerance', type=float, default=1.5, help="allowed slowdown/growth ratio")
+    parser.add_argument('--save-baseline', help="write this run's results as JSON")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.messages.split(',')]
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            results[str(size)] = run_size(size, args.users, args.repeat, workdir)
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(results, indent=2))
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,269 @@
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from preprocessor import PARSER_VERSION
+
+MAX_ENTRIES = 512
+MAX_BYTES = 512 * 1024 * 1024
+
+# Parsed chats kept on disk, shared by restarts and by every worker on the machine
+DISK_CACHE_DIR = os.environ.get('CHAT_CACHE_DIR', Path.home() / '.cache' / 'whatsapp-chat-analyzer')
+DISK_CACHE_MAX_BYTES = int(os.environ.get('CHAT_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+
+
+def content_hash(data):
+    """
+    Returns a hex digest identifying the uploaded chat by its bytes
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def estimate_size(value):
+    """
+    Rough number of bytes held by a cached value
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, np.ndarray):
+        return sys.getsizeof(value) if value.base is None else value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (bytes, str)):
+        return sys.getsizeof(value)
+    if hasattr(value, '__dict__'):
+        return sys.getsizeof(value) + estimate_size(vars(value))
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by entry count and estimated bytes.
+    Cached values are shared between reruns, so callers must treat them as read-only.
+    Memory a value keeps alive outside of itself can be attached to its entry, see attach().
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                _, old_size, attached = self._entries.pop(key)
+                self.total_bytes -= old_size + attached
+            if size > self.max_bytes:
+                # Too big to ever fit, keeping it would only flush everything else
+                return value
+            self._entries[key] = (value, size, 0)
+            self.total_bytes += size
+            self._evict()
+        return value
+
+    def attach(self, key, nbytes):
+        """
+        Counts nbytes that live as long as the entry's value, such as data built from it after it
+        was cached, towards the entry's size. Replaces the bytes attached before, and evicts
+        entries past max_bytes, so dropping the entry is what frees them.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return
+            value, size, attached = self._entries[key]
+            self._entries[key] = (value, size, nbytes)
+            self.total_bytes += nbytes - attached
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            _, (_, size, attached) = self._entries.popitem(last=False)
+            self.total_bytes -= size + attached
+
+    def get_or_compute(self, key, func, *args, **kwargs):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = self.put(key, func(*args, **kwargs))
+        return value
+
+    def discard(self, predicate):
+        """
+        Drops every entry whose key matches predicate(key)
+        """
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                _, size, attached = self._entries.pop(key)
+                self.total_bytes -= size + attached
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+class ExportIndex:
+    """
+    Remembers the chats parsed by this process by their first line, which every later export
+    of the same chat repeats, to recognize an upload that only adds messages to a known export.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._exports = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _first_line(data):
+        end = data.find(b'\n', 0, 4096)
+        return content_hash(data[:end if end != -1 else 4096])
+
+    def add(self, chat_hash, data):
+        with self._lock:
+            self._exports[chat_hash] = (self._first_line(data), len(data))
+            self._exports.move_to_end(chat_hash)
+            while len(self._exports) > self.max_entries:
+                self._exports.popitem(last=False)
+
+    def find_previous(self, data):
+        """
+        Returns (chat hash, length) of the longest known export that data extends, or None
+        """
+        first_line = self._first_line(data)
+        with self._lock:
+            candidates = [(length, chat_hash) for chat_hash, (line, length) in self._exports.items()
+                          if line == first_line and length < len(data)]
+        for length, chat_hash in sorted(candidates, reverse=True):
+            if content_hash(memoryview(data)[:length]) == chat_hash:
+                return chat_hash, length
+        return None
+
+
+class DiskCache:
+    """
+    Parsed chats saved as Arrow IPC files, keyed by content hash and parser version, and rendered
+    images saved as PNG files under a name. Chat files are memory-mapped on load; the least
+    recently used files of either kind are deleted past max_bytes.
+    """
+
+    def __init__(self, directory=DISK_CACHE_DIR, max_bytes=DISK_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def path(self, chat_hash):
+        return self.directory / f'{chat_hash}-v{PARSER_VERSION}.arrow'
+
+    def load(self, chat_hash):
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+
+        path = self.path(chat_hash)
+        try:
+            with pa.memory_map(str(path)) as source:
+                df = ipc.open_file(source).read_all().to_pandas()
+        except FileNotFoundError:
+            return None
+        except (OSError, pa.ArrowInvalid):
+            # Truncated or corrupt entry, parse again and overwrite it
+            path.unlink(missing_ok=True)
+            return None
+        # mtime doubles as the last-used time for eviction
+        os.utime(path)
+        return df
+
+    def save(self, chat_hash, df):
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pandas(df)
+        # Write under a temporary name so other workers never map a half-written file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as sink, ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp_path, self.path(chat_hash))
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        self.evict()
+
+    def image_path(self, name):
+        return self.directory / f'{name}.png'
+
+    def load_image(self, name):
+        path = self.image_path(name)
+        try:
+            image = path.read_bytes()
+        except OSError:
+            return None
+        os.utime(path)
+        return image
+
+    def save_image(self, name, image):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as sink:
+                sink.write(image)
+            os.replace(tmp_path, self.image_path(name))
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in [*self.directory.glob('*.arrow'), *self.directory.glob('*.png')]:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def get_or_parse(self, chat_hash, parse):
+        df = self.load(chat_hash)
+        if df is None:
+            df = parse()
+            try:
+                self.save(chat_hash, df)
+            except OSError:
+                # A read-only or full cache directory only costs the next load a re-parse
+                pass
+        return df
@@ -0,0 +1,196 @@
+"""
+Matplotlib charts of the analysis page.
+
+Every chart function draws a figure from helper.py results, and render() turns it into image
+bytes. Figures are built with matplotlib.figure.Figure instead of pyplot: sessions draw at the
+same time on their own script threads, and pyplot's current figure and figure registry are shared
+by all of them. A figure nobody references is simply garbage collected. Matplotlib is only
+imported once the first chart is drawn. Word clouds skip matplotlib and are saved straight to PNG.
+"""
+import io
+
+# What st.pyplot renders with: twice matplotlib's default dpi, for high-DPI screens
+DPI = 200
+
+
+# ------------------- Rendering -------------------
+def render(fig, fmt='png'):
+    """
+    Returns the figure as PNG (or SVG) bytes
+    """
+    image = io.BytesIO()
+    fig.savefig(image, format=fmt, dpi=DPI, bbox_inches='tight')
+    return image.getvalue()
+
+
+def _figure(**options):
+    from matplotlib.figure import Figure
+
+    fig = Figure(**options)
+    return fig, fig.subplots()
+
+
+def _style_xticks(ax, **style):
+    # What plt.xticks(**style) does, on this figure's axes only
+    for label in ax.get_xticklabels():
+        label.set(**style)
+
+
+# ------------------- Most Busy Users -------------------
+def busy_users_chart(x, height_px):
+    # Calculate figure height to match the table next to it
+    fig_height = height_px / 72  # Convert pixels to inches (72 DPI)
+    fig, ax = _figure(figsize=(5, fig_height))
+    ax.bar(x.index, x.values, color='steelblue')
+    _style_xticks(ax, rotation=45, ha='right')
+    ax.set_xlabel('Users')
+    ax.set_ylabel('No. of Messages')
+    fig.tight_layout()
+    return fig
+
+
+# ------------------- Monthly Timeline -------------------
+def timeline_chart(timeline):
+    fig, ax = _figure(figsize=(12, 6))
+    ax.plot(timeline["time"], timeline["Message"], marker='o', linewidth=2, markersize=6, color='#4ECDC4')
+
+    # Fill area under the line
+    ax.fill_between(timeline["time"], timeline["Message"], alpha=0.3, color='#4ECDC4')
+
+    # Styling
+    ax.set_xlabel('Month', fontsize=14, fontweight='bold')
+    ax.set_ylabel('Number of Messages', fontsize=14, fontweight='bold')
+    ax.set_title('Message Activity Over Time', fontsize=16, fontweight='bold', pad=20)
+
+    # Rotate x-axis labels
+    _style_xticks(ax, rotation=45, ha='right', fontsize=10)
+    ax.tick_params(axis='y', labelsize=10)
+
+    # Add grid for better readability
+    ax.grid(True, alpha=0.3, linestyle='--')
+
+    # Add background color
+    ax.set_facecolor('#f8f9fa')
+    fig.patch.set_facecolor('white')
+
+    # Tight layout to prevent label cutoff
+    fig.tight_layout()
+    return fig
+
+
+# ------------------- Most Active Weekday / Month -------------------
+def weekday_chart(weekday_counts, y_max):
+    fig, ax = _figure()
+    ax.bar(weekday_counts.index, weekday_counts.values, color='skyblue')
+    for i, v in enumerate(weekday_counts.values):
+        ax.text(i, v + 0.5, str(v), ha='center', va='bottom', fontsize=9)
+
+    ax.set_ylim(0, y_max)
+    ax.set_xlabel("Day of the Week")
+    ax.set_ylabel("Number of Messages")
+    ax.set_title("Messages per Weekday", fontsize=12, fontweight='bold')
+    ax.grid(axis='y', linestyle='--', alpha=0.3)
+
+    # Stretch to fill the column
+    fig.tight_layout(pad=1.0)
+    return fig
+
+
+def month_chart(month_counts, y_max):
+    month_counts_sorted = month_counts[::-1]
+
+    fig, ax = _figure()
+    ax.bar(month_counts_sorted.index, month_counts_sorted.values, color='orange')
+    for i, v in enumerate(month_counts_sorted.values):
+        ax.text(i, v + 0.5, str(v), ha='center', va='bottom', fontsize=9)
+
+    ax.set_ylim(0, y_max)
+    ax.set_xlabel("Month")
+    ax.set_ylabel("Number of Messages")
+    ax.set_title("Messages per Month", fontsize=12, fontweight='bold')
+    _style_xticks(ax, rotation=45)
+    ax.grid(axis='y', linestyle='--', alpha=0.3)
+
+    # Stretch to fill the column
+    fig.tight_layout(pad=1.0)
+    return fig
+
+
+# ------------------- Words -------------------
+def wordcloud_image(wc):
+    """
+    PNG bytes of a laid-out word cloud, drawn by WordCloud itself at its own resolution. No
+    figure is involved, so unlike the other charts it can be drawn off the script thread.
+    """
+    image = io.BytesIO()
+    wc.to_image().save(image, format='PNG')
+    return image.getvalue()
+
+
+def common_words_chart(most_common_df):
+    fig, ax = _figure(figsize=(10, 8))
+    ax.barh(most_common_df[0], most_common_df[1], color='skyblue')
+
+    # Add the exact numbers at the end of each bar
+    for i, (word, count) in enumerate(zip(most_common_df[0], most_common_df[1])):
+        ax.text(count, i, f' {count}', va='center', fontsize=10)
+
+    ax.set_xlabel('Count', fontsize=12)
+    ax.set_ylabel('Words', fontsize=12)
+    ax.set_title('Most Common Words', fontsize=14)
+    ax.invert_yaxis()
+    return fig
+
+
+# ------------------- Activity Heatmap -------------------
+def heatmap_chart(heatmap_data, selected_user):
+    import seaborn as sns
+
+    fig, ax = _figure(figsize=(12, 6))
+    sns.heatmap(heatmap_data, cmap="YlGnBu", linewidths=.5, cbar=True, ax=ax,
+                yticklabels=True, xticklabels=True)
+
+    ax.set_xlabel("Hour of Day")
+    ax.set_ylabel("Weekday")
+    ax.set_title(f"Most Active Times for {selected_user}")
+    return fig
+
+
+# ------------------- Conversations -------------------
+def session_lengths_chart(sessions):
+    fig, ax = _figure()
+    ax.hist(sessions['Minutes'], bins=30, color='#4ECDC4', edgecolor='white')
+    ax.set_xlabel("Length (minutes)")
+    ax.set_ylabel("Conversations")
+    ax.set_title("Conversation Lengths", fontsize=12, fontweight='bold')
+    ax.grid(axis='y', linestyle='--', alpha=0.3)
+    fig.tight_layout(pad=1.0)
+    return fig
+
+
+def reply_matrix_chart(matrix):
+    import seaborn as sns
+
+    size = min(4 + 0.5 * len(matrix), 14)
+    fig, ax = _figure(figsize=(size + 2, size))
+    # Numbers only fit in the cells of smaller groups
+    sns.heatmap(matrix, cmap="YlGnBu", linewidths=.5, cbar=True, ax=ax, annot=len(matrix) <= 12, fmt='d',
+                yticklabels=True, xticklabels=True)
+    ax.set_xlabel("Replied to")
+    ax.set_ylabel("Replied by")
+    ax.set_title("Who Replies to Whom")
+    return fig
+
+
+# ------------------- Keyword Search -------------------
+def keyword_timeline_chart(timeline, query):
+    fig, ax = _figure(figsize=(12, 4))
+    ax.plot(timeline["time"], timeline["Mentions"], marker='o', linewidth=2, markersize=4, color='#25D366')
+    ax.fill_between(timeline["time"], timeline["Mentions"], alpha=0.3, color='#25D366')
+    ax.set_xlabel('Month')
+    ax.set_ylabel('Messages')
+    ax.set_title(f'Messages Mentioning "{query}"', fontsize=12, fontweight='bold')
+    _style_xticks(ax, rotation=45, ha='right', fontsize=9)
+    ax.grid(True, alpha=0.3, linestyle='--')
+    fig.tight_layout()
+    return fig
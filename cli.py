@@ -0,0 +1,228 @@
+"""
+Headless batch analysis of exported WhatsApp chats.
+
+    python cli.py exports/ --output results/ --outputs stats,timeline,words --format csv
+
+Every .txt export and every .txt chat inside a .zip export is parsed with preprocessor.preprocess
+and run through the helper.py functions in a process pool. Streamlit and the plotting libraries are
+never imported, and the libraries behind each output (emoji, urlextract) only load when requested.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+import helper
+import preprocessor
+import uploads
+
+FORMATS = ['json', 'csv', 'parquet']
+
+
+# ------------------- Outputs -------------------
+def _stats(selected_user, df):
+    num_messages, num_words, num_media, num_links = helper.fetch_stats(selected_user, df)
+    return pd.DataFrame([{'messages': num_messages, 'words': num_words, 'media': num_media, 'links': num_links}])
+
+
+def _users(selected_user, df):
+    if selected_user != "Overall":
+        return None
+    return helper.most_busy_users(df)[1]
+
+
+def _timeline(selected_user, df):
+    return helper.monthly_timeline(selected_user, df)
+
+
+def _weekdays(selected_user, df):
+    return helper.most_active_weekdays(selected_user, df).rename_axis('weekday').reset_index(name='messages')
+
+
+def _months(selected_user, df):
+    return helper.most_active_months(selected_user, df).rename_axis('month').reset_index(name='messages')
+
+
+def _heatmap(selected_user, df):
+    heatmap = helper.activity_heatmap_normalized(selected_user, df)
+    heatmap.columns = [str(hour) for hour in heatmap.columns]
+    return heatmap.rename_axis('weekday').reset_index()
+
+
+def _words(selected_user, df):
+    return helper.most_common_words(selected_user, df).rename(columns={0: 'word', 1: 'count'})
+
+
+def _bigrams(selected_user, df):
+    return helper.common_phrases(selected_user, df, kind='bigrams')
+
+
+def _trigrams(selected_user, df):
+    return helper.common_phrases(selected_user, df, kind='trigrams')
+
+
+def _emojis(selected_user, df):
+    return helper.emoji_helper(selected_user, df)
+
+
+def _domains(selected_user, df):
+    return helper.link_domains(selected_user, df)
+
+
+OUTPUTS = {
+    'stats': _stats,
+    'users': _users,
+    'timeline': _timeline,
+    'weekdays': _weekdays,
+    'months': _months,
+    'heatmap': _heatmap,
+    'words': _words,
+    'bigrams': _bigrams,
+    'trigrams': _trigrams,
+    'emojis': _emojis,
+    'domains': _domains,
+}
+
+
+# ------------------- Exports -------------------
+def find_exports(paths):
+    """
+    Returns (name, path, zip member) for every chat in the given files and directories
+    """
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(p for p in path.rglob('*') if p.suffix.lower() in ('.txt', '.zip')))
+        else:
+            files.append(path)
+
+    exports = []
+    names = set()
+
+    def add(name, path, member):
+        # Chats with the same file name in different places get a numbered output directory
+        unique, n = name, 1
+        while unique in names:
+            n += 1
+            unique = f'{name}-{n}'
+        names.add(unique)
+        exports.append((unique, path, member))
+
+    for path in files:
+        if path.suffix.lower() != '.zip':
+            add(path.stem, path, None)
+            continue
+        with zipfile.ZipFile(path) as archive:
+            members = uploads.chat_members(archive.namelist())
+        for member in members:
+            add(path.stem if len(members) == 1 else f'{path.stem}-{Path(member).stem}', path, member)
+    return exports
+
+
+@contextmanager
+def open_chat(path, member):
+    if member is None:
+        with open(path, 'rb') as raw:
+            yield uploads.open_text(raw)
+        return
+    # Decoded while it is read, the member is never extracted to disk
+    with zipfile.ZipFile(path) as archive, archive.open(member) as raw:
+        yield uploads.open_text(raw)
+
+
+def _write(table, path, fmt):
+    if fmt == 'json':
+        table.to_json(path, orient='records', force_ascii=False, date_format='iso')
+    elif fmt == 'csv':
+        table.to_csv(path, index=False)
+    else:
+        table.to_parquet(path, index=False)
+
+
+def analyze_export(name, path, member, output_dir, outputs, fmt, per_user):
+    """
+    Parses one export and writes one file per requested output, with a row group per user
+    """
+    started = time.perf_counter()
+    with open_chat(path, member) as chat:
+        df = preprocessor.preprocess(chat)
+
+    selected_users = ["Overall"]
+    if per_user:
+        selected_users += sorted(df['User'].unique().tolist())
+
+    chat_dir = Path(output_dir) / name
+    chat_dir.mkdir(parents=True, exist_ok=True)
+    for output in outputs:
+        tables = []
+        for selected_user in selected_users:
+            table = OUTPUTS[output](selected_user, df)
+            if table is not None:
+                tables.append(table.assign(user=selected_user)[['user', *table.columns]])
+        non_empty = [table for table in tables if not table.empty]
+        result = pd.concat(non_empty, ignore_index=True) if non_empty else tables[0]
+        _write(result, chat_dir / f'{output}.{fmt}', fmt)
+
+    return {'chat': name, 'messages': len(df), 'users': int(df['User'].nunique()),
+            'seconds': round(time.perf_counter() - started, 3)}
+
+
+# ------------------- Command line -------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze WhatsApp chat exports without the web app.")
+    parser.add_argument('paths', nargs='+', help=".txt/.zip exports or directories containing them")
+    parser.add_argument('-o', '--output', default='analysis', help="directory to write results to")
+    parser.add_argument('--outputs', default=','.join(OUTPUTS),
+                        help=f"comma-separated outputs to write (default: all of {','.join(OUTPUTS)})")
+    parser.add_argument('-f', '--format', choices=FORMATS, default='json')
+    parser.add_argument('--per-user', action='store_true', help="also write rows for every participant")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    args.outputs = [output.strip() for output in args.outputs.split(',') if output.strip()]
+    unknown = [output for output in args.outputs if output not in OUTPUTS]
+    if unknown:
+        parser.error(f"unknown outputs: {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    exports = find_exports(args.paths)
+    if not exports:
+        print("No .txt or .zip exports found", file=sys.stderr)
+        return 1
+
+    jobs = [(name, path, member, args.output, args.outputs, args.format, args.per_user)
+            for name, path, member in exports]
+    failures = 0
+
+    def report(name, result):
+        nonlocal failures
+        try:
+            print(json.dumps(result(), ensure_ascii=False), flush=True)
+        except Exception as e:
+            failures += 1
+            print(f"{name}: {e}", file=sys.stderr, flush=True)
+
+    if args.workers <= 1:
+        for job in jobs:
+            report(job[0], lambda: analyze_export(*job))
+    else:
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(jobs))) as pool:
+            futures = {pool.submit(analyze_export, *job): job[0] for job in jobs}
+            for future in as_completed(futures):
+                report(futures[future], future.result)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Sessions and replies of a chat, from its Timestamp and User columns.
+
+Messages are sorted by time, so everything comes from differences between consecutive messages:
+a silence longer than the idle gap starts a new session, and a message in the same session as the
+previous one but from someone else is a reply to it, sent as long after it as the gap between them.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+# Minutes of silence after which the next message starts a new conversation
+SESSION_GAP_MINUTES = int(os.environ.get('CHAT_SESSION_GAP_MINUTES', 60))
+QUANTILES = {'Median': 0.5, 'P95': 0.95}
+
+
+class Conversations:
+    """
+    Sessions and replies of the messages with the given sorted timestamps (datetime64[ns]) and
+    user codes (positions in users). Built with a few vectorized passes over the messages;
+    per-user reply times are read from one sort of the replies.
+    """
+
+    def __init__(self, timestamps, user_codes, users, gap_minutes=SESSION_GAP_MINUTES):
+        self.users = users
+        self.gap_minutes = gap_minutes
+        n_users = max(len(users), 1)
+        seconds = timestamps.astype('datetime64[s]').astype(np.int64)
+        gaps = np.diff(seconds)
+
+        new_session = np.ones(len(seconds), dtype=bool)
+        new_session[1:] = gaps > gap_minutes * 60
+        session_ids = np.cumsum(new_session) - 1
+
+        reply = ~new_session[1:] & (user_codes[1:] != user_codes[:-1])
+        self.responders = user_codes[1:][reply]
+        self.replied_to = user_codes[:-1][reply]
+        self.reply_seconds = gaps[reply]
+        self.reply_counts = np.bincount(self.responders * n_users + self.replied_to,
+                                        minlength=n_users * n_users).reshape(n_users, n_users)
+
+        starts = np.flatnonzero(new_session)
+        # No messages, no sessions: appending the end would make up one ending at row -1
+        ends = np.append(starts[1:], len(seconds)) - 1 if len(starts) else starts
+        self.session_starts = timestamps[starts]
+        self.session_seconds = seconds[ends] - seconds[starts]
+        self.session_messages = ends - starts + 1
+        # Distinct (session, user) pairs, found by hashing instead of sorting
+        pairs = pd.unique(session_ids * n_users + user_codes)
+        self._pair_sessions, self._pair_users = pairs // n_users, pairs % n_users
+        self.session_participants = np.bincount(self._pair_sessions, minlength=len(starts))
+
+    def _user_code(self, selected_user):
+        return self.users.get_indexer([selected_user])[0]
+
+    def response_times(self, selected_user):
+        """
+        Replies sent by each user and their median and 95th percentile reply time in minutes
+        """
+        quantiles = _group_quantiles(self.responders, self.reply_seconds / 60, len(self.users),
+                                     list(QUANTILES.values()))
+        table = pd.DataFrame(quantiles.round(1), index=pd.Index(self.users, name='User'), columns=list(QUANTILES))
+        table.insert(0, 'Replies', np.bincount(self.responders, minlength=len(self.users)))
+        table = table[table['Replies'] > 0]
+        if selected_user != 'Overall':
+            table = table[table.index == selected_user]
+        return table.sort_values('Replies', ascending=False, kind='stable')
+
+    def reply_matrix(self, selected_user):
+        """
+        Replies sent by each user (rows) to each user (columns). For one user, the replies they
+        sent to and received from everyone they talked with.
+        """
+        counts = self.reply_counts[:len(self.users), :len(self.users)]
+        if selected_user != 'Overall':
+            code = self._user_code(selected_user)
+            if code == -1:
+                return pd.DataFrame(columns=['Sent', 'Received'], dtype=np.int64)
+            table = pd.DataFrame({'Sent': counts[code], 'Received': counts[:, code]},
+                                 index=pd.Index(self.users, name='User'))
+            table = table[(table['Sent'] > 0) | (table['Received'] > 0)]
+            return table.iloc[np.argsort(-(table['Sent'] + table['Received']).to_numpy(), kind='stable')]
+        active = counts.any(axis=1) | counts.any(axis=0)
+        return pd.DataFrame(counts[np.ix_(active, active)], index=pd.Index(self.users[active], name='From'),
+                            columns=pd.Index(self.users[active], name='To'))
+
+    def sessions(self, selected_user):
+        """
+        Start, length in minutes, messages and participants of every session (the user took part in)
+        """
+        table = pd.DataFrame({
+            'Start': self.session_starts,
+            'Minutes': (self.session_seconds / 60).round(1),
+            'Messages': self.session_messages,
+            'Participants': self.session_participants,
+        })
+        if selected_user != 'Overall':
+            sessions = self._pair_sessions[self._pair_users == self._user_code(selected_user)]
+            table = table.iloc[np.sort(sessions)]
+        return table.reset_index(drop=True)
+
+
+def _group_quantiles(groups, values, n_groups, quantiles):
+    """
+    Quantiles (linearly interpolated, like numpy's default) of values within each group, NaN for empty groups
+    """
+    order = np.lexsort((values, groups))
+    values = values[order]
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    present = counts > 0
+    result = np.full((n_groups, len(quantiles)), np.nan)
+    for column, quantile in enumerate(quantiles):
+        position = starts[present] + (counts[present] - 1) * quantile
+        low, high = np.floor(position).astype(np.intp), np.ceil(position).astype(np.intp)
+        result[present, column] = values[low] + (values[high] - values[low]) * (position - low)
+    return result
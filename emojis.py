@@ -0,0 +1,42 @@
+import re
+from functools import lru_cache
+
+import pandas as pd
+
+from patterns import find_all, trie_pattern
+
+
+@lru_cache(maxsize=None)
+def emoji_pattern():
+    """
+    Compiled matcher for every emoji sequence the emoji package knows, longest first,
+    so ZWJ families, skin tones, keycaps and flags are matched as a single emoji
+    """
+    import emoji
+
+    return re.compile('(?P<emoji>' + trie_pattern(emoji.EMOJI_DATA) + ')')
+
+
+@lru_cache(maxsize=None)
+def canonical_emojis():
+    """
+    Maps every emoji sequence to the fully-qualified form of the same emoji,
+    so '❤' and '❤️' are counted together
+    """
+    import emoji
+
+    best = {}
+    for sequence, data in emoji.EMOJI_DATA.items():
+        current = best.get(data['en'])
+        if current is None or data['status'] < emoji.EMOJI_DATA[current]['status']:
+            best[data['en']] = sequence
+    return {sequence: best[data['en']] for sequence, data in emoji.EMOJI_DATA.items()}
+
+
+def extract_emojis(messages):
+    """
+    Finds every emoji in a Series of messages in one batched pass.
+    Returns a (row position, emoji) frame in order of appearance, with emojis in their fully-qualified form.
+    """
+    rows, found = find_all(messages, emoji_pattern(), 'emoji')
+    return pd.DataFrame({'position': rows, 'emoji': pd.Series(found, dtype=object).map(canonical_emojis())})
@@ -0,0 +1,161 @@
+"""
+Most frequent words, phrases and emojis of every user, in bounded memory.
+
+Terms are counted in Space-Saving summaries: at most `capacity` terms per user, each with an
+estimated count that is never below the true one and the most it can be above it. Messages are
+read a batch at a time, and every batch's exact counts are merged into the summaries, so memory
+follows the batch size and the capacity instead of the number of distinct terms in the chat.
+Without a capacity nothing is ever dropped and the counts are exact.
+"""
+import os
+import string
+
+import numpy as np
+import pandas as pd
+
+from emojis import extract_emojis
+from tokens import DIRECTION_MARKS, stop_words, tokenize, word_messages
+
+# Chats with more messages count their words and emojis in summaries instead of full token tables
+APPROX_MIN_MESSAGES = int(os.environ.get('CHAT_APPROX_MIN_MESSAGES', 500_000))
+# Terms kept per user and kind by an approximate summary
+TOPK_CAPACITY = int(os.environ.get('CHAT_TOPK_CAPACITY', 1000))
+BATCH_MESSAGES = 50_000
+# Words in a phrase of each kind
+NGRAMS = {'bigrams': 2, 'trigrams': 3}
+KINDS = ['words', *NGRAMS, 'emojis']
+
+
+class SpaceSaving:
+    """
+    Summary of (user, term) counts, with one more user code, n_users, for everyone together.
+    The table holds every kept term's estimated count and error, sorted by user and then by
+    count; floors[user] bounds the count of any term the user's summary dropped.
+    """
+
+    def __init__(self, n_users, capacity=None):
+        self.n_users = n_users
+        self.capacity = capacity
+        self.table = pd.DataFrame({'user': np.empty(0, dtype=np.int64), 'term': np.empty(0, dtype=object),
+                                   'count': np.empty(0, dtype=np.int64), 'error': np.empty(0, dtype=np.int64)})
+        self.floors = np.zeros(n_users + 1, dtype=np.int64)
+
+    def add(self, user_codes, terms):
+        """
+        Counts one batch of term occurrences by the given user codes
+        """
+        batch = pd.DataFrame({'user': np.asarray(user_codes, dtype=np.int64), 'term': terms})
+        per_user = batch.groupby(['user', 'term'], sort=False).size()
+        overall = batch.groupby('term', sort=False).size()
+        table = pd.DataFrame({
+            'user': np.concatenate([per_user.index.get_level_values(0).to_numpy(),
+                                    np.full(len(overall), self.n_users, dtype=np.int64)]),
+            'term': np.concatenate([per_user.index.get_level_values(1).to_numpy(dtype=object),
+                                    overall.index.to_numpy(dtype=object)]),
+            'count': np.concatenate([per_user.to_numpy(), overall.to_numpy()]).astype(np.int64),
+        })
+        table['error'] = 0
+        self._merge(table, np.zeros(self.n_users + 1, dtype=np.int64))
+
+    def merge(self, other, user_map=None, other_map=None, n_users=None):
+        """
+        Summary of both summaries' streams. User codes can be mapped to those of a new user list of
+        n_users, such as when an extended chat gains participants.
+        """
+        n_users = self.n_users if n_users is None else n_users
+        merged = SpaceSaving(n_users, self.capacity)
+        merged.table, merged.floors = self._remapped(user_map, n_users)
+        table, floors = other._remapped(other_map, n_users)
+        merged._merge(table, floors)
+        return merged
+
+    def _remapped(self, user_map, n_users):
+        if user_map is None:
+            return self.table, self.floors
+        # The "everyone" code moves to the end of the new user list
+        user_map = np.append(user_map, n_users)
+        floors = np.zeros(n_users + 1, dtype=np.int64)
+        floors[user_map] = self.floors
+        table = self.table.assign(user=user_map[self.table['user'].to_numpy()])
+        return table.sort_values(['user', 'count'], ascending=[True, False], kind='stable'), floors
+
+    def _merge(self, table, floors):
+        """
+        Adds a (user, term, count, error) table whose absent terms count at most floors. A term
+        missing from one side is counted at that side's floor, then every user keeps its
+        capacity most frequent terms and the floors rise to the highest count dropped.
+        """
+        merged = self.table.merge(table, on=['user', 'term'], how='outer', suffixes=('_a', '_b'), sort=False)
+        users = merged['user'].to_numpy()
+        count_a, count_b = merged['count_a'].to_numpy(), merged['count_b'].to_numpy()
+        in_a, in_b = ~np.isnan(count_a), ~np.isnan(count_b)
+        floor_a, floor_b = self.floors[users], floors[users]
+        merged = pd.DataFrame({
+            'user': users,
+            'term': merged['term'].to_numpy(),
+            'count': (np.where(in_a, count_a, floor_a) + np.where(in_b, count_b, floor_b)).astype(np.int64),
+            'error': (np.where(in_a, merged['error_a'].to_numpy(), floor_a)
+                      + np.where(in_b, merged['error_b'].to_numpy(), floor_b)).astype(np.int64),
+        }).sort_values(['user', 'count'], ascending=[True, False], kind='stable')
+        self.floors = self.floors + floors
+
+        if self.capacity is not None:
+            kept = merged.groupby('user', sort=False).cumcount().to_numpy() < self.capacity
+            dropped = merged[~kept]
+            np.maximum.at(self.floors, dropped['user'].to_numpy(), dropped['count'].to_numpy())
+            merged = merged[kept]
+        self.table = merged.reset_index(drop=True)
+
+    def top(self, user=None, limit=None):
+        """
+        (term, count, error) of the user's (or everyone's) most frequent terms, most frequent first
+        """
+        user = self.n_users if user is None else user
+        first, stop = np.searchsorted(self.table['user'].to_numpy(), [user, user + 1])
+        stop = stop if limit is None else min(stop, first + limit)
+        return self.table.iloc[first:stop][['term', 'count', 'error']].reset_index(drop=True)
+
+
+def _phrases(batch, n, stop_words):
+    """
+    (row position, phrase) of every run of n consecutive lowercase words in the batch's messages
+    that neither starts nor ends with a stopword
+    """
+    words = batch['Message'].reset_index(drop=True)[word_messages(batch)].str.split().explode().dropna()
+    words = words.str.replace(DIRECTION_MARKS, '', regex=True).str.strip(string.punctuation).str.lower()
+    # Emojis and other symbols are counted on their own, not as words of a phrase
+    words = words[words.str.contains(r'\w', regex=True)]
+    is_stop = words.isin(stop_words).to_numpy()
+    rows, words = words.index.to_numpy(), words.to_numpy(dtype=object)
+    if len(words) < n:
+        return rows[:0], words[:0]
+
+    starts = np.flatnonzero(rows[:len(rows) - n + 1] == rows[n - 1:])
+    starts = starts[~(is_stop[starts] | is_stop[starts + n - 1])]
+    phrases = words[starts]
+    for offset in range(1, n):
+        phrases = phrases + ' ' + words[starts + offset]
+    return rows[starts], phrases
+
+
+def count_terms(df, kind, user_codes, n_users, capacity=None, batch_size=BATCH_MESSAGES):
+    """
+    Summary of the terms of one kind (see KINDS) in df's messages, read batch_size rows at a time.
+    user_codes are the users of df's rows. For words, also returns the number of words of every row.
+    """
+    summary = SpaceSaving(n_users, capacity)
+    num_words = np.zeros(len(df), dtype=np.int64) if kind == 'words' else None
+    words = stop_words()
+    for start in range(0, len(df), batch_size):
+        batch = df.iloc[start:start + batch_size]
+        if kind == 'words':
+            batch_words, tokens = tokenize(batch, words)
+            num_words[start:start + len(batch)] = batch_words
+            rows, terms = tokens['message_id'].to_numpy(), tokens['token'].to_numpy(dtype=object)
+        elif kind == 'emojis':
+            found = extract_emojis(batch['Message'])
+            rows, terms = found['position'].to_numpy(), found['emoji'].to_numpy(dtype=object)
+        else:
+            rows, terms = _phrases(batch, NGRAMS[kind], words)
+        summary.add(user_codes[start + rows], terms)
+    return summary, num_words
@@ -1,146 +1,139 @@
 import pandas as pd
-from urlextract import URLExtract
-from collections import Counter
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
-from nltk.corpus import stopwords
-import string
-import re
-import emoji
-import nltk
+
+from aggregates import get_aggregates, WEEKDAYS, HOURS
+from conversations import SESSION_GAP_MINUTES
+from preprocessor import NOTIFICATION_USER, TRAILING_MARKS
+from search import SEARCH_LIMIT
 
 # ------------------- Fetch Stats -------------------
-def fetch_stats(selected_user, df):
-    if selected_user != "Overall":
-        df = df[df['User'] == selected_user]
+def fetch_stats(selected_user, df, window=None):
+    store = get_aggregates(df, window)
 
-    if df.empty:
+    if store.message_count(selected_user) == 0:
         return 0, 0, 0, 0
 
-    num_messages = df.shape[0]
+    stats = store.stats(selected_user)
+
+    return int(stats['messages']), int(stats['words']), int(stats['media']), int(stats['links'])
 
-    words = []
-    for message in df["Message"]:
-        words.extend(message.split())
-    num_words = len(words)
 
-    num_media = df[df["Message"].str.contains(r'\b(?:image|video|audio|document|sticker) omitted\b', regex=True, na=False)].shape[0]
+def message_counts(selected_user, df, window=None):
+    """
+    Messages and media shared, the stats that are counted when the chat is loaded
+    """
+    store = get_aggregates(df, window)
+    return store.message_count(selected_user), store.media_count(selected_user)
 
-    extractor = URLExtract()
-    link = []
-    for message in df["Message"]:
-        link.extend(extractor.find_urls(message))
-    num_links = len(link)
 
-    return num_messages, num_words, num_media, num_links
+# ------------------- Shared Link Domains -------------------
+def link_domains(selected_user, df, window=None):
+    domain_counts = get_aggregates(df, window).domain_counts(selected_user)
+
+    if domain_counts.empty:
+        return pd.DataFrame(columns=['Domain', 'Count'])
+
+    return pd.DataFrame({'Domain': domain_counts.index, 'Count': domain_counts.to_numpy()})
 
 
 # ------------------- Most Busy Users -------------------
-def most_busy_users(df):
-    if df.empty:
+def most_busy_users(df, window=None):
+    store = get_aggregates(df, window)
+    counts = pd.Series(store.messages, index=pd.Index(store.users, name='User'), name='count')
+    # Group events aren't anyone's messages
+    counts = counts[(counts > 0) & (counts.index != NOTIFICATION_USER)].sort_values(ascending=False, kind='stable')
+    if counts.empty:
         return pd.Series(dtype=int), pd.DataFrame(columns=['Name', 'Percentage'])
-    x = df["User"].value_counts().head()
-    df_perc = round((df['User'].value_counts() / df.shape[0]) * 100, 2).reset_index()
+    x = counts.head()
+    df_perc = round((counts / counts.sum()) * 100, 2).reset_index()
     df_perc = df_perc.rename(columns={df_perc.columns[0]: 'Name', df_perc.columns[1]: 'Percentage'})
     return x, df_perc
 
 
 # ------------------- Word Cloud -------------------
-def create_wordcloud(selected_user, df):
-    if selected_user != "Overall":
-        df = df[df['User'] == selected_user]
+WORDCLOUD_MAX_WORDS = 200
+# Fewer words on a smaller canvas, laid out in a fraction of the time, shown until the full cloud is ready
+PREVIEW_MAX_WORDS = 50
 
-    if df.empty:
-        return None
 
-    df = df[~df["Message"].str.contains(r'\b(?:image|video|audio|document|sticker) omitted\b', regex=True, na=False)]
-    df = df[~df["Message"].str.contains("Waiting for this message", na=False)]
-    df = df[~df["Message"].str.contains("This message was deleted", na=False)]
-    df = df[df["Message"].notna()]
-    df = df[df["Message"].str.strip() != ""]
+def wordcloud_frequencies(selected_user, df, window=None, max_words=WORDCLOUD_MAX_WORDS):
+    """
+    The max_words most frequent words for the word cloud, without WordCloud's stopwords,
+    with case variants merged under their most frequent spelling like WordCloud.process_text does
+    """
+    from wordcloud import STOPWORDS
 
-    if df.empty:
-        return None
+    word_counts = get_aggregates(df, window).word_counts(selected_user)
+    word_counts = word_counts[~word_counts.index.str.lower().isin(STOPWORDS)]
 
-    text = df['Message'].str.cat(sep=" ")
-    if not text.strip():
-        return None
+    if word_counts.empty:
+        return {}
 
-    from wordcloud import STOPWORDS
-    # Add random_state to make wordcloud deterministic
-    wc = WordCloud(
-        background_color="white",
-        max_words=200,
-        width=800,
-        height=400,
-        stopwords=STOPWORDS,
-        random_state=42  # This makes the layout consistent
-    ).generate(text)
-    return wc
+    lowered = word_counts.index.str.lower()
+    spelling = pd.Series(word_counts.index, index=lowered).groupby(level=0, sort=False).first()
+    totals = word_counts.groupby(lowered, sort=False).sum().sort_values(ascending=False, kind='stable')
+    totals = totals.head(max_words)
+    return dict(zip(spelling[totals.index], totals.to_numpy()))
 
 
-# ------------------- Most Common Words -------------------
-def most_common_words(selected_user, df):
-    if selected_user != "Overall":
-        df = df[df['User'] == selected_user]
+def layout_wordcloud(frequencies, preview=False):
+    """
+    Lays out a word cloud of frequencies: the full one at 800x400 drawn at twice that size,
+    or a preview of the most frequent words at 400x200
+    """
+    from wordcloud import WordCloud
 
-    if df.empty:
-        return pd.DataFrame(columns=[0, 1])
+    if preview:
+        frequencies = dict(list(frequencies.items())[:PREVIEW_MAX_WORDS])
+    # Add random_state to make wordcloud deterministic
+    return WordCloud(
+        background_color="white",
+        max_words=PREVIEW_MAX_WORDS if preview else WORDCLOUD_MAX_WORDS,
+        width=400 if preview else 800,
+        height=200 if preview else 400,
+        # Drawn at twice the size the words were placed at, which costs no extra layout time
+        scale=1 if preview else 2,
+        random_state=42  # This makes the layout consistent
+    ).generate_from_frequencies(frequencies)
 
-    nltk.download('stopwords', quiet=True)
-    stop_words = set(stopwords.words('english'))
 
-    temp = df[df["User"] != "Group_Notification"]
-    temp = temp[~temp["Message"].str.contains(r'\b(?:image|video|audio|document|sticker) omitted\b', regex=True, na=False)]
-    temp = temp[~temp["Message"].str.contains("Waiting for this message", na=False)]
-    temp = temp[~temp["Message"].str.contains("This message was deleted", na=False)]
-    temp = temp[~temp["Message"].str.contains("This message was edited", na=False)]
-    temp = temp[temp["Message"].notna()]
-    temp = temp[temp["Message"].str.strip() != ""]
+def create_wordcloud(selected_user, df, window=None, preview=False):
+    frequencies = wordcloud_frequencies(selected_user, df, window)
 
-    def clean_unicode(message):
-        return re.sub(r'[\u200e\u200f\u202a-\u202e]', '', message).strip()
+    if not frequencies:
+        return None
 
-    temp['Message'] = temp['Message'].apply(clean_unicode)
+    return layout_wordcloud(frequencies, preview)
 
-    def remove_stopwords(message):
-        words = message.split()
-        filtered = [w.strip(string.punctuation) for w in words if w.lower() not in stop_words]
-        filtered = [w for w in filtered if w and len(w) > 1]
-        return ' '.join(filtered)
 
-    temp['Message'] = temp['Message'].apply(remove_stopwords)
-    temp = temp[temp["Message"].str.strip() != ""]
+# ------------------- Most Common Words -------------------
+def most_common_words(selected_user, df, window=None):
+    word_counts = get_aggregates(df, window).word_counts(selected_user).head(10)
 
-    if temp.empty:
+    if word_counts.empty:
         return pd.DataFrame(columns=[0, 1])
 
-    words = []
-    for message in temp["Message"]:
-        words.extend(message.split())
-
-    words = [w for w in words if len(w) > 1 and not all(c in string.punctuation for c in w)]
-    most_common_df = pd.DataFrame(Counter(words).most_common(10))
+    most_common_df = pd.DataFrame(list(word_counts.items()))
     return most_common_df
 
 
-# ------------------- Emoji Analysis -------------------
-def emoji_helper(selected_user, df):
-    if selected_user != "Overall":
-        df = df[df['User'] == selected_user]
+# ------------------- Common Phrases -------------------
+def common_phrases(selected_user, df, window=None, kind='bigrams', limit=10):
+    """
+    Most frequent phrases of a kind ('bigrams' or 'trigrams'). On chats counted approximately,
+    Error is how far above the true count each Count may be.
+    """
+    top = get_aggregates(df, window).top_terms(kind, selected_user, limit)[0]
+    return top.rename(columns={'term': 'Phrase', 'count': 'Count', 'error': 'Error'})
 
-    if df.empty:
-        return pd.DataFrame(columns=['Emoji', 'Count', 'Percentage'])
 
-    emojis = []
-    for message in df["Message"]:
-        emojis.extend([c for c in message if emoji.is_emoji(c)])
+# ------------------- Emoji Analysis -------------------
+def emoji_helper(selected_user, df, window=None):
+    emoji_counts = get_aggregates(df, window).emoji_counts(selected_user)
 
-    if not emojis:
+    if emoji_counts.empty:
         return pd.DataFrame(columns=['Emoji', 'Count', 'Percentage'])
 
-    emoji_df = pd.DataFrame(Counter(emojis).most_common(), columns=['Emoji', 'Count'])
-    emoji_df['Count'] = pd.to_numeric(emoji_df['Count'], errors='coerce').fillna(0)
+    emoji_df = pd.DataFrame({'Emoji': emoji_counts.index, 'Count': emoji_counts.to_numpy()})
 
     total = emoji_df['Count'].sum()
     emoji_df['Percentage'] = round((emoji_df['Count'] / total * 100), 2) if total > 0 else 0
@@ -149,70 +142,100 @@ def emoji_helper(selected_user, df):
 
 
 # ------------------- Monthly Timeline -------------------
-def monthly_timeline(selected_user, df):
-    if selected_user != "Overall":
-        df = df[df['User'] == selected_user]
+def monthly_timeline(selected_user, df, window=None):
+    monthly = get_aggregates(df, window).monthly_counts(selected_user)
 
-    if df.empty:
-        return pd.DataFrame(columns=['time', 'Message'])
+    if monthly.empty:
+        # Typed columns: matplotlib can't plot empty object ones
+        return pd.DataFrame({'time': pd.Series(dtype='datetime64[ns]'), 'Message': pd.Series(dtype='int64')})
 
-    timeline = df.groupby(['year', 'month_num', 'month']).count()['Message'].reset_index()
-    timeline['time'] = timeline['month'] + '-' + timeline['year'].astype(str)
+    timeline = monthly.reset_index()
+    timeline['time'] = timeline['month'].astype(str) + '-' + timeline['year'].astype(str)
     return timeline
 
 
 # ------------------- Most Active Weekdays -------------------
-def most_active_weekdays(selected_user, df):
-    if selected_user != "Overall":
-        df = df[df['User'] == selected_user]
-
-    if df.empty:
-        return pd.Series([0]*7, index=['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday'])
-
-    df['only_date'] = pd.to_datetime(df['only_date'])
-    df['weekday'] = df['only_date'].dt.day_name()
-    weekday_counts = df.groupby('weekday').count()['Message']
-    weekdays_order = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
-    weekday_counts = weekday_counts.reindex(weekdays_order, fill_value=0)
+def most_active_weekdays(selected_user, df, window=None):
+    store = get_aggregates(df, window)
+
+    if store.message_count(selected_user) == 0:
+        return pd.Series([0]*7, index=WEEKDAYS)
+
+    weekday_counts = pd.Series(store.weekday_hour(selected_user).sum(axis=1),
+                               index=pd.Index(WEEKDAYS, name='weekday'), name='Message')
     return weekday_counts
 
 
 # ------------------- Most Active Months -------------------
-def most_active_months(selected_user, df):
-    if selected_user != "Overall":
-        df = df[df['User'] == selected_user]
+def most_active_months(selected_user, df, window=None):
+    monthly = get_aggregates(df, window).monthly_counts(selected_user)
 
-    if df.empty:
+    if monthly.empty:
         return pd.Series(dtype=int)
 
-    df['only_date'] = pd.to_datetime(df['only_date'])
-    df['month_year'] = df['only_date'].dt.strftime('%b %Y')
-    active_months = df.groupby('month_year').count()['Message'].sort_values(ascending=False)
+    months = monthly.index.get_level_values('month').astype(str).str[:3]
+    years = monthly.index.get_level_values('year').astype(str)
+    active_months = pd.Series(monthly.to_numpy(), index=pd.Index(months + ' ' + years, name='month_year'),
+                              name='Message')
+    active_months = active_months.groupby(level=0).sum().sort_values(ascending=False)
     return active_months
 
-def activity_heatmap_normalized(selected_user, df):
+def activity_heatmap_normalized(selected_user, df, window=None):
     """
     Returns a normalized pivot table (0-1) for heatmap: weekdays vs hours
     """
-    if selected_user != "Overall":
-        df = df[df['User'] == selected_user]
+    store = get_aggregates(df, window)
 
-    if df.empty:
-        weekdays_order = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
-        hours_order = list(range(24))
-        return pd.DataFrame(0, index=weekdays_order, columns=hours_order)
+    if store.message_count(selected_user) == 0:
+        return pd.DataFrame(0, index=WEEKDAYS, columns=HOURS)
 
-    df['only_date'] = pd.to_datetime(df['only_date'], errors='coerce')
-    df['weekday'] = df['only_date'].dt.day_name()
-    df['hour'] = df['hour'].astype(int)
-
-    heatmap_data = df.pivot_table(index='weekday', columns='hour', values='Message', aggfunc='count', fill_value=0)
-
-    weekdays_order = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
-    hours_order = list(range(24))
-    heatmap_data = heatmap_data.reindex(index=weekdays_order, columns=hours_order, fill_value=0)
+    heatmap_data = pd.DataFrame(store.weekday_hour(selected_user),
+                                index=pd.Index(WEEKDAYS, name='weekday'), columns=pd.Index(HOURS, name='hour'))
 
     # Normalize by max
     heatmap_data = heatmap_data / heatmap_data.values.max()
 
-    return heatmap_data
\ No newline at end of file
+    return heatmap_data
+
+
+# ------------------- Conversations -------------------
+def response_times(selected_user, df, window=None, gap=SESSION_GAP_MINUTES):
+    return get_aggregates(df, window).conversations(gap).response_times(selected_user)
+
+
+def reply_matrix(selected_user, df, window=None, gap=SESSION_GAP_MINUTES):
+    return get_aggregates(df, window).conversations(gap).reply_matrix(selected_user)
+
+
+def conversation_sessions(selected_user, df, window=None, gap=SESSION_GAP_MINUTES):
+    return get_aggregates(df, window).conversations(gap).sessions(selected_user)
+
+
+# ------------------- Keyword Search -------------------
+def search_messages(selected_user, df, window=None, query='', limit=SEARCH_LIMIT):
+    """
+    Number of messages containing every word of query, and the latest limit of them, newest first
+    """
+    rows = get_aggregates(df, window).search(query, selected_user)
+    latest = df.iloc[rows[::-1][:limit]][['Timestamp', 'User', 'Message']].reset_index(drop=True)
+    latest['Message'] = latest['Message'].str.rstrip(TRAILING_MARKS)
+    return len(rows), latest
+
+
+def keyword_users(selected_user, df, window=None, query=''):
+    mentions = get_aggregates(df, window).mentions(query, selected_user)[0]
+    if selected_user != 'Overall':
+        mentions = mentions[mentions.index == selected_user]
+    mentions = mentions[mentions > 0].sort_values(ascending=False, kind='stable')
+    return mentions.rename('Mentions').reset_index()
+
+
+def keyword_timeline(selected_user, df, window=None, query=''):
+    monthly = get_aggregates(df, window).mentions(query, selected_user)[1]
+
+    if monthly.empty:
+        return pd.DataFrame(columns=['time', 'Mentions'])
+
+    timeline = monthly.rename('Mentions').reset_index()
+    timeline['time'] = timeline['month'].astype(str) + '-' + timeline['year'].astype(str)
+    return timeline
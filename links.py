@@ -0,0 +1,65 @@
+import re
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+from patterns import find_all, trie_pattern
+
+
+@lru_cache(maxsize=None)
+def url_pattern():
+    """
+    Compiled URL matcher built from URLExtract's TLD list, loaded once per process.
+    None when this URLExtract version no longer has the private accessor it is read with.
+    """
+    from urlextract import URLExtract
+
+    # URLExtract has no public accessor for its cached TLD list
+    try:
+        tlds = {tld.lstrip('.').lower() for tld in URLExtract()._load_cached_tlds()}
+    except AttributeError:
+        return None
+
+    label = r'[^\W_](?:[\w-]{0,61}[^\W_])?'
+    return re.compile(
+        r'(?<![\w@.-])'                              # not inside a word or an e-mail address
+        r'(?:(?:https?|ftp)://)?'
+        r'(?P<host>(?:' + label + r'\.)+(?:' + trie_pattern(tlds) + r'))'
+        r'(?![\w-])'                                 # the TLD ends the host name
+        r'(?::\d{1,5})?'
+        r'(?:[/?#][^\s<>"]*)?',
+        re.IGNORECASE,
+    )
+
+
+def extract_links(messages):
+    """
+    Finds every link in a Series of messages in one batched pass.
+    Returns the number of links per message and a (row position, domain) frame of all links found.
+    """
+    pattern = url_pattern()
+    rows, hosts = _find_urls(messages) if pattern is None else find_all(messages, pattern, 'host')
+
+    counts = np.bincount(rows, minlength=len(messages)).astype(np.int64)
+    domains = pd.Series(hosts, dtype=object).str.lower().str.removeprefix('www.')
+    return counts, pd.DataFrame({'position': rows, 'domain': domains.to_numpy()})
+
+
+def _find_urls(messages):
+    """
+    (row position, host) of every link found by URLExtract's public find_urls, one message at a time.
+    Much slower than the compiled pattern, only used when its TLD list can't be read.
+    """
+    from urlextract import URLExtract
+
+    extractor = URLExtract()
+    rows, hosts = [], []
+    for row, message in enumerate(messages):
+        if not isinstance(message, str):
+            continue
+        for url in extractor.find_urls(message):
+            rows.append(row)
+            hosts.append(urlsplit(url if '://' in url else '//' + url).hostname or '')
+    return np.array(rows, dtype=np.int64), np.array(hosts, dtype=object)
@@ -0,0 +1,64 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+
+def trie_pattern(words):
+    """
+    Builds a regex alternation of words shaped as a trie, so matching costs one
+    branch per character instead of one attempt per word. Longer words win over their prefixes.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    # One character-class test rejects most positions before any branch is tried
+    return '(?=' + char_class(char for char in trie if char) + ')' + _node_pattern(trie)
+
+
+def char_class(chars):
+    """
+    Regex character class of chars, with consecutive code points collapsed into ranges
+    (the regex engine tests ranges one by one outside the Basic Multilingual Plane)
+    """
+    points = sorted({ord(char) for char in chars})
+    ranges = []
+    for point in points:
+        if ranges and ranges[-1][1] == point - 1:
+            ranges[-1][1] = point
+        else:
+            ranges.append([point, point])
+    parts = [_class_char(chr(low)) if low == high else _class_char(chr(low)) + '-' + _class_char(chr(high))
+             for low, high in ranges]
+    return '[' + ''.join(parts) + ']'
+
+
+def _class_char(char):
+    return '\\' + char if char in '\\]^-[' else char
+
+
+def _node_pattern(node):
+    branches = [re.escape(char) + _node_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    if '' in node:
+        # A word ends here, the longer continuations are tried first
+        pattern = '(?:' + pattern + ')?'
+    return pattern
+
+
+def find_all(messages, pattern, group):
+    """
+    Runs pattern over a Series of messages in one batched pass.
+    Returns the row position of every match, in order of appearance, and the text of the named group.
+    """
+    found = messages.str.extractall(pattern)
+    if found.empty:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=object)
+    positions = pd.Series(np.arange(len(messages)), index=messages.index)
+    rows = positions.loc[found.index.get_level_values(0)].to_numpy()
+    return rows, found[group].to_numpy()
@@ -1,78 +1,404 @@
+import calendar
 import re
 
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 
+# Bump whenever the frame returned by preprocess changes, cached parses of older versions are ignored
+PARSER_VERSION = 5
 
-def preprocess(data):
-    pattern = r'\[(\d{1,2}/\d{1,2}/\d{2,4},\s+\d{1,2}:\d{2}:\d{2}\s+[AP]M)\]\s+(.*?)(?=\[\d{1,2}/\d{1,2}/\d{2,4},\s+\d{1,2}:\d{2}:\d{2}\s+[AP]M\]|$)'
-    matches = re.findall(pattern, data, re.DOTALL)
+MONTHS = list(calendar.month_name)[1:]
+MESSAGE_KINDS = ['text', 'media', 'deleted', 'system']
+KIND_CODES = {kind: code for code, kind in enumerate(MESSAGE_KINDS)}
+# Rows classified as this are system messages and are dropped
+FILTERED = -1
+# User of the system messages that are kept, which user lists and word counts leave out
+NOTIFICATION_USER = 'Group_Notification'
 
-    df = pd.DataFrame(matches, columns=['Timestamp', 'Message'])
+# Rows whose User contains any of these are system messages
+system_keywords = [
+    'You',  # When you perform actions
+    'Messages and calls are end-to-end encrypted',
+    'created this group',
+    'added',
+    'removed',
+    'left',
+    'changed',
+    'deleted this message',
+    'This message was deleted',
+    'image omitted',
+    'video omitted',
+    'audio omitted',
+    'document omitted',
+    'sticker omitted',
+    'GIF omitted',
+    'Waiting for this message'
+]
+
+# Rows whose Message matches any of these are system messages
+system_message_patterns = [
+    r'^\s*$',  # Empty messages
+    r'Messages and calls are end-to-end encrypted',
+    r'created this group',
+    r'added you',
+    r'changed the',
+    r'Security code changed'
+]
+
+# Placeholders of the attachments left out of an export, iOS names the kind and Android writes <Media omitted>
+MEDIA_PATTERN = r'\b(?:image|video|video note|audio|document|sticker|GIF|Contact card|Media) omitted\b'
+DELETED_PATTERN = r'This message was deleted|Waiting for this message'
+
+system_user_re = re.compile(
+    r'(?i:' + '|'.join(system_keywords) + r')'
+    # Group names (usually has ':' in the name), actual users keep ':' in saved contact names
+    r'|^[A-Z\s]+:'
+    r'|^\s*$'
+)
+
+# Each alternative looks ahead over the whole message, so the earlier kinds win
+message_kind_re = re.compile(
+    r'(?=[\s\S]*?(?P<system>(?i:' + '|'.join(system_message_patterns) + r')))'
+    r'|(?=[\s\S]*?(?P<media>' + MEDIA_PATTERN + r'))'
+    r'|(?=[\s\S]*?(?P<deleted>' + DELETED_PATTERN + r'))'
+)
+
+# What may come before the first timestamp of an appended tail: line breaks and direction marks
+leading_marks_re = re.compile(r'[\s\u200e\u200f\u202a-\u202e]*')
+# What a message can end with depending on where its export was cut
+TRAILING_MARKS = ' \t\r\n\u200e\u200f\u202a\u202b\u202c\u202d\u202e'
+
+# Messages are turned into DataFrame columns this many at a time
+BATCH_SIZE = 50_000
+CHUNK_SIZE = 1 << 20
+
+
+# ------------------- Export formats -------------------
+class ExportFormat:
+    """
+    How an export writes the timestamp that starts every message: iOS puts it in brackets
+    ("[31/12/2020, 21:41:05] User: ..."), Android before a dash ("31/12/2020, 21:41 - User: ...").
+    order is the order of the date fields ('mdy', 'dmy' or 'ymd'); hours are 12-hour with AM/PM
+    when twelve_hour is set, and seconds may be missing.
+    """
+
+    def __init__(self, bracketed=True, order='mdy', twelve_hour=True, seconds=True):
+        self.bracketed, self.order, self.twelve_hour, self.seconds = bracketed, order, twelve_hour, seconds
+        date = r'\d{4}[/.-]\d{1,2}[/.-]\d{1,2}' if order == 'ymd' else r'\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}'
+        time = r'\d{1,2}:\d{2}' + (r':\d{2}' if seconds else '')
+        meridiem = r'\s*[AaPp]\.?\s?[Mm]\.?' if twelve_hour else ''
+        stamp = rf'({date},?\s+{time}{meridiem})'
+        # The only group is the timestamp; what follows it on the line starts with whitespace
+        if bracketed:
+            self.timestamp_re = re.compile(rf'\[{stamp}\]')
+        else:
+            self.timestamp_re = re.compile(rf'^[\u200e\u200f]*{stamp}\s-(?=\s)', re.MULTILINE)
+
+    def __repr__(self):
+        return (f"ExportFormat(bracketed={self.bracketed}, order={self.order!r}, "
+                f"twelve_hour={self.twelve_hour}, seconds={self.seconds})")
+
+
+# US iOS exports, what the app was first written for
+IOS_FORMAT = ExportFormat()
+
+# Characters looked at to tell the format of an export
+SNIFF_CHARS = 64 * 1024
+
+# A timestamp starting a line in any supported format, split into the fields sniff_format looks at
+any_timestamp_re = re.compile(
+    r'^[\u200e\u200f]*(\[)?(\d{1,4})[/.-](\d{1,2})[/.-](\d{1,4}),?\s+\d{1,2}:\d{2}(:\d{2})?'
+    r'(\s*[AaPp]\.?\s?[Mm]\.?)?(?(1)\]|\s-)\s',
+    re.MULTILINE)
+
+
+def sniff_format(text):
+    """
+    ExportFormat of an export from its first SNIFF_CHARS characters. Day and month are told apart
+    by a field above 12 or else by which order keeps the dates ascending; US iOS when nothing matches.
+    """
+    matches = any_timestamp_re.findall(text[:SNIFF_CHARS])
+    if not matches:
+        return IOS_FORMAT
+    bracketed = sum(1 for match in matches if match[0]) * 2 >= len(matches)
+    matches = [match for match in matches if bool(match[0]) == bracketed]
+    twelve_hour = any(match[5] for match in matches)
+    seconds = any(match[4] for match in matches)
+
+    fields = np.array([[int(match[1]), int(match[2]), int(match[3])] for match in matches])
+    if any(len(match[1]) == 4 for match in matches):
+        order = 'ymd'
+    elif (fields[:, 0] > 12).any():
+        order = 'dmy'
+    elif (fields[:, 1] > 12).any():
+        order = 'mdy'
+    else:
+        def backward_steps(month, day):
+            dates = fields[:, 2] * 10_000 + month * 100 + day
+            return int((np.diff(dates) < 0).sum())
+
+        month_first, day_first = backward_steps(fields[:, 0], fields[:, 1]), backward_steps(fields[:, 1], fields[:, 0])
+        if month_first != day_first:
+            order = 'mdy' if month_first < day_first else 'dmy'
+        else:
+            # Still ambiguous: 12-hour clocks mostly come with US dates, 24-hour ones with day first
+            order = 'mdy' if twelve_hour else 'dmy'
+    return ExportFormat(bracketed, order, twelve_hour, seconds)
+
+
+# Byte values kept by parse_timestamps, every other byte separates two numbers
+_DIGITS = np.full(256, ord(' '), dtype=np.uint8)
+_DIGITS[ord('0'):ord('9') + 1] = np.arange(ord('0'), ord('9') + 1)
+
+
+def parse_timestamps(timestamps, export_format):
+    """
+    Parses timestamp strings of export_format into datetime64[ns] from their digits, without a
+    strptime per row. Raises ValueError when they don't have the format's fields or a date is invalid.
+    """
+    n_fields = 6 if export_format.seconds else 5
+    text = np.frombuffer('\n'.join(timestamps).encode('ascii', 'replace'), dtype=np.uint8)
+    numbers = np.fromstring(_DIGITS[text].tobytes(), dtype=np.int64, sep=' ') if len(text) else np.zeros(0, np.int64)
+    if numbers.size != len(timestamps) * n_fields:
+        raise ValueError(f"Timestamps don't match {export_format}")
+    fields = numbers.reshape(len(timestamps), n_fields)
+
+    a, b, c = fields[:, 0], fields[:, 1], fields[:, 2]
+    year, month, day = {'mdy': (c, a, b), 'dmy': (c, b, a), 'ymd': (a, b, c)}[export_format.order]
+    # Two-digit years like strptime's %y
+    year = np.where(year >= 100, year, np.where(year < 69, year + 2000, year + 1900))
+    hour, minute = fields[:, 3], fields[:, 4]
+    second = fields[:, 5] if export_format.seconds else 0
+    if export_format.twelve_hour:
+        valid_hour = (hour >= 1) & (hour <= 12)
+        # P is only ever in the AM/PM part, the row of each one is the number of line breaks before it
+        row = np.cumsum(text == ord('\n'))
+        pm = np.zeros(len(timestamps), dtype=bool)
+        pm[row[(text == ord('P')) | (text == ord('p'))]] = True
+        hour = hour % 12 + pm * 12
+    else:
+        valid_hour = hour <= 23
+
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    days = months.astype('datetime64[D]') + (day - 1)
+    valid = (valid_hour & (month >= 1) & (month <= 12) & (day >= 1) & (minute <= 59) & (second <= 59)
+             & (days.astype('datetime64[M]') == months))
+    if not valid.all():
+        raise ValueError(f"Invalid timestamp {timestamps[int(np.argmin(valid))]!r} for {export_format}")
+    return (days.astype('datetime64[s]') + (hour * 3600 + minute * 60 + second)).astype('datetime64[ns]')
+
+
+def iter_lines(data, chunk_size=CHUNK_SIZE, head=''):
+    """
+    Yields lines (line endings kept) from a string or a text file object, after head, text
+    already read from it. File objects are read in fixed-size chunks so the whole export is
+    never held at once.
+    """
+    if isinstance(data, str):
+        start = 0
+        end = data.find('\n')
+        while end != -1:
+            yield data[start:end + 1]
+            start = end + 1
+            end = data.find('\n', start)
+        if start < len(data):
+            yield data[start:]
+        return
+
+    tail = ''
+    chunk = head or data.read(chunk_size)
+    while chunk:
+        lines = (tail + chunk).split('\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line + '\n'
+        chunk = data.read(chunk_size)
+    if tail:
+        yield tail
+
+
+def iter_messages(lines, export_format=IOS_FORMAT):
+    """
+    Yields (timestamp, body) pairs, joining continuation lines into the previous message.
+    A timestamp not followed by whitespace ends the current message without starting a new one.
+    """
+    split = export_format.timestamp_re.split
+    timestamp = None
+    body = []
+    for line in lines:
+        pieces = split(line)
+        if timestamp is not None:
+            body.append(pieces[0])
+        for i in range(1, len(pieces), 2):
+            if timestamp is not None:
+                yield timestamp, ''.join(body)
+            timestamp, body = None, []
+            rest = pieces[i + 1]
+            if rest[:1].isspace():
+                timestamp, body = pieces[i], [rest]
+    if timestamp is not None:
+        yield timestamp, ''.join(body)
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _build_frame(batch, export_format):
+    df = pd.DataFrame(batch, columns=['Timestamp', 'Message'])
 
     df['Message'] = df['Message'].str.strip()
-    df['Timestamp'] = pd.to_datetime(df['Timestamp'], format='%m/%d/%y, %I:%M:%S %p')
+    df['Timestamp'] = parse_timestamps(df['Timestamp'].tolist(), export_format)
 
-    df[['User', 'Message']] = df['Message'].str.split(':', n=1, expand=True)
+    parts = df['Message'].str.split(':', n=1, expand=True)
+    if parts.shape[1] == 1 and not df.empty:
+        # No message in this batch had a ':', so the split produced a single column
+        parts[1] = None
+    df[['User', 'Message']] = parts
     df['User'] = df['User'].str.strip()
     df['Message'] = df['Message'].str.strip()
 
     df['User'] = df['User'].str.replace('~', '').str.strip()
-    df['User'] = df['User'].fillna('Group Notification')
-
-    df["year"] = df["Timestamp"].dt.year
-    df["month"] = df["Timestamp"].dt.month_name()
-    df["month_num"] = df["Timestamp"].dt.month
-    df["day"] = df["Timestamp"].dt.day
-    df["hour"] = df["Timestamp"].dt.hour
-    df["minute"] = df["Timestamp"].dt.minute
-    df['only_date'] = df['Timestamp'].dt.date
-
-    # In your preprocessor.py, after creating the dataframe and before returning it:
-
-    # Filter out system messages and common non-user entries
-    system_keywords = [
-        'You',  # When you perform actions
-        'Messages and calls are end-to-end encrypted',
-        'created this group',
-        'added',
-        'removed',
-        'left',
-        'changed',
-        'deleted this message',
-        'This message was deleted',
-        'image omitted',
-        'video omitted',
-        'audio omitted',
-        'document omitted',
-        'sticker omitted',
-        'GIF omitted',
-        'Waiting for this message'
-    ]
-
-    # Remove rows where User column contains any system keywords
-    for keyword in system_keywords:
-        df = df[~df['User'].str.contains(keyword, case=False, na=False)]
-
-    # Remove rows where User contains group names (usually has ':' in the name)
-    # But keep actual users who might have ':' in saved contact names
-    df = df[~df['User'].str.contains(r'^[A-Z\s]+:', regex=True, na=False)]
-
-    # Remove rows where Message is a system message
-    system_message_patterns = [
-        r'^\s*$',  # Empty messages
-        r'Messages and calls are end-to-end encrypted',
-        r'created this group',
-        r'added you',
-        r'changed the',
-        r'Security code changed'
-    ]
-
-    for pattern in system_message_patterns:
-        df = df[~df['Message'].str.contains(pattern, case=False, na=False, regex=True)]
-
-    # Remove any rows where User is NaN or empty
-    df = df[df['User'].notna()]
-    df = df[df['User'].str.strip() != '']
-
-
-    return df
\ No newline at end of file
+    df['User'] = df['User'].fillna(NOTIFICATION_USER)
+
+    # Small integer calendar fields, anything else (dates, weekdays) is derived from Timestamp on demand
+    df["year"] = df["Timestamp"].dt.year.astype('int16')
+    df["month"] = pd.Categorical.from_codes(df["Timestamp"].dt.month - 1, MONTHS)
+    df["month_num"] = df["Timestamp"].dt.month.astype('int8')
+    df["day"] = df["Timestamp"].dt.day.astype('int8')
+    df["hour"] = df["Timestamp"].dt.hour.astype('int8')
+    df["minute"] = df["Timestamp"].dt.minute.astype('int8')
+    return df
+
+
+def _classify(df):
+    """
+    Message kind codes for every row, from one pass over the User and Message columns.
+    Rows matched by the system filters get FILTERED.
+    """
+    user_match = system_user_re.search
+    message_match = message_kind_re.match
+    codes = np.empty(len(df), dtype=np.int8)
+    for row, (user, message) in enumerate(zip(df['User'], df['Message'])):
+        if user_match(user):
+            codes[row] = FILTERED
+        elif not isinstance(message, str):
+            # Lines without a "User:" part that the keyword filter didn't catch
+            codes[row] = KIND_CODES['system']
+        else:
+            match = message_match(message)
+            if match is None:
+                codes[row] = KIND_CODES['text']
+            elif match.lastgroup == 'system':
+                codes[row] = FILTERED
+            else:
+                codes[row] = KIND_CODES[match.lastgroup]
+    return codes
+
+
+def preprocess(data, batch_size=BATCH_SIZE, arrow_strings=False, start=0, export_format=None):
+    """
+    Parses a chat export into one row per message, numbered from start and sorted by Timestamp.
+    The export format is sniffed from the first lines unless given.
+    User, month and kind are categoricals and calendar fields are small integers;
+    arrow_strings=True also stores Message as PyArrow-backed strings.
+    """
+    head = data[:SNIFF_CHARS] if isinstance(data, str) else data.read(SNIFF_CHARS)
+    if export_format is None:
+        export_format = sniff_format(head)
+    lines = iter_lines(data) if isinstance(data, str) else iter_lines(data, head=head)
+
+    frames = []
+    for batch in _batched(iter_messages(lines, export_format), batch_size):
+        df = _build_frame(batch, export_format)
+        df.index += start
+        start += len(batch)
+
+        # Filter out system messages and common non-user entries, the rest keep their kind
+        codes = _classify(df)
+        keep = codes != FILTERED
+        df['kind'] = pd.Categorical.from_codes(np.where(keep, codes, KIND_CODES['system']), MESSAGE_KINDS)
+        # Android writes group events without a "User:" part, the whole line isn't a participant
+        df.loc[codes == KIND_CODES['system'], 'User'] = NOTIFICATION_USER
+        frames.append(df[keep])
+
+    if not frames:
+        raise ValueError("No WhatsApp messages found")
+    df = pd.concat(frames)
+    if not df['Timestamp'].is_monotonic_increasing:
+        # Clock changes can put messages out of order, date windows rely on sorted timestamps
+        df = df.sort_values('Timestamp', kind='stable')
+
+    df['User'] = df['User'].astype('category')
+    if arrow_strings:
+        df['Message'] = df['Message'].astype('string[pyarrow]')
+    return df
+
+
+def preprocess_tail(df, tail_data, export_format=IOS_FORMAT, **options):
+    """
+    Parses only tail_data, the text a newer export of the same chat has after the export df was
+    parsed from, and returns df with the new messages appended. export_format is the newer
+    export's, sniffed from its start. Raises ValueError when the tail doesn't start with a new
+    message or starts before the last known one.
+    """
+    first = export_format.timestamp_re.search(tail_data)
+    if first is None or not leading_marks_re.fullmatch(tail_data[:first.start()]):
+        raise ValueError("The new export doesn't continue the previous one")
+
+    tail = preprocess(tail_data, start=df.index.max() + 1, export_format=export_format, **options)
+    if len(tail) and tail['Timestamp'].iloc[0] < df['Timestamp'].iloc[-1]:
+        raise ValueError("The new export starts before the last known message")
+    if tail.empty:
+        return df.copy(deep=False)
+    users = union_categoricals([df['User'], tail['User']], sort_categories=True)
+    merged = pd.concat([df, tail])
+    merged['User'] = users
+    return merged
+
+
+def merge_chats(frames):
+    """
+    Merges the parses of several, possibly overlapping, exports of one chat into one timeline.
+    Rows are matched by (Timestamp, User, message hash) and a message is kept as many times
+    as the export that has it most often, so repeats within one export survive.
+    """
+    frames = sorted(frames, key=lambda df: df['Timestamp'].iloc[0])
+    if len(frames) == 1:
+        return frames[0]
+    users = union_categoricals([df['User'] for df in frames], sort_categories=True)
+    df = pd.concat(frames, ignore_index=True)
+    df['User'] = users
+
+    keys = pd.DataFrame({
+        'export': np.repeat(np.arange(len(frames)), [len(frame) for frame in frames]),
+        'Timestamp': df['Timestamp'],
+        'User': df['User'].cat.codes,
+        # The last message of an export lacks the direction mark the next line would have added to it
+        'Message': pd.util.hash_pandas_object(df['Message'].str.rstrip(TRAILING_MARKS), index=False),
+    })
+    keys['occurrence'] = keys.groupby(['export', 'Timestamp', 'User', 'Message'], sort=False).cumcount()
+    # A later export has the overlap as it would be in one full export, it wasn't cut after its last message
+    df = df[~keys.duplicated(['Timestamp', 'User', 'Message', 'occurrence'], keep='last')]
+    if not df['Timestamp'].is_monotonic_increasing:
+        df = df.sort_values('Timestamp', kind='stable')
+    return df.reset_index(drop=True)
+
+
+def memory_report(df):
+    """
+    Bytes held by each column of a parsed chat, in total and per message
+    """
+    usage = df.memory_usage(deep=True)
+    report = pd.DataFrame({'dtype': df.dtypes.astype(str).reindex(usage.index, fill_value=''), 'bytes': usage})
+    report.loc['Total'] = ['', usage.sum()]
+    report['bytes_per_message'] = (report['bytes'] / max(len(df), 1)).round(1)
+    return report
@@ -0,0 +1,82 @@
+"""
+Per-stage timing and memory instrumentation.
+
+Every stage records its wall time, the rows it processed and the change in process memory (RSS).
+RSS is process-wide, so it is only recorded for stages on the thread that runs the analysis:
+stages computed in a thread pool at the same time as others would be charged their allocations.
+Records are kept for the Performance panel and logged as one JSON object per stage on the
+"profiling" logger, so slow stages can be found in production logs.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def rss_bytes():
+    """
+    Current resident memory of this process, or None where it can't be read cheaply
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak rather than current memory off Linux: kilobytes there, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+class Profiler:
+    """
+    Collects the stages of one analysis run. context is added to every logged record.
+    Stages run on other threads than the one that created the profiler get no memory change.
+    """
+
+    def __init__(self, **context):
+        self.context = context
+        self.records = []
+        self._thread = threading.get_ident()
+
+    @contextmanager
+    def stage(self, name, rows=None, **fields):
+        """
+        Times the block. The yielded record can be updated inside it, e.g. with the rows produced.
+        """
+        record = {'stage': name, 'rows': rows, **fields}
+        memory_before = rss_bytes() if threading.get_ident() == self._thread else None
+        started = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record['error'] = type(e).__name__
+            raise
+        finally:
+            record['seconds'] = round(time.perf_counter() - started, 4)
+            memory_after = rss_bytes() if memory_before is not None else None
+            if memory_after is not None:
+                record['memory_delta_mb'] = round((memory_after - memory_before) / 2 ** 20, 2)
+            self.records.append(record)
+            logger.info(json.dumps({**self.context, **record}, ensure_ascii=False, default=str))
+
+    def table(self):
+        """
+        The recorded stages as a DataFrame, slowest first
+        """
+        import pandas as pd
+
+        columns = ['stage', 'seconds', 'rows', 'memory_delta_mb', 'cached']
+        table = pd.DataFrame(self.records)
+        table = table.reindex(columns=columns + [c for c in table.columns if c not in columns])
+        table['rows'] = table['rows'].astype('Int64')
+        return table.sort_values('seconds', ascending=False, ignore_index=True)
@@ -0,0 +1,166 @@
+"""
+Keyword search of a chat through an inverted index of its words.
+
+Every text message is split into lowercase words once, and each word points to the sorted row
+positions of the messages containing it. Next to these postings, the number of those messages is
+kept per (user, month), so who mentions a word and when are read from a few counters instead of a
+scan of the Message column.
+"""
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from preprocessor import NOTIFICATION_USER
+
+# Letters and digits; apostrophes inside a word are part of it ("don't")
+WORD_PATTERN = r"\w+(?:['’]\w+)*"
+# Joins the messages into one text for a single regex pass
+SEPARATOR = '\x1f'
+EDITED_MARKER = '<this message was edited>'
+# Matching messages listed by the app, newest first
+SEARCH_LIMIT = int(os.environ.get('CHAT_SEARCH_LIMIT', 200))
+
+word_re = re.compile(WORD_PATTERN)
+split_re = re.compile(WORD_PATTERN + '|' + SEPARATOR)
+
+
+def searchable(df):
+    """
+    Boolean mask of the messages that are indexed: text sent by the participants
+    """
+    return ((df['kind'] == 'text') & (df['User'] != NOTIFICATION_USER)).to_numpy()
+
+
+def split_words(messages):
+    """
+    Splits messages into lowercase words in one regex pass over their joined text.
+    Returns the distinct words, and the word code and message position of every occurrence.
+    """
+    messages = list(messages)
+    text = SEPARATOR.join(messages)
+    if text.count(SEPARATOR) != max(len(messages) - 1, 0):
+        text = SEPARATOR.join(message.replace(SEPARATOR, ' ') for message in messages)
+    text = text.lower().replace(EDITED_MARKER, ' ')
+
+    codes, words = pd.factorize(np.array(split_re.findall(text), dtype=object))
+    separator = np.flatnonzero(words == SEPARATOR)
+    if not len(separator):
+        return words, codes, np.zeros(len(codes), dtype=np.int64)
+    is_separator = codes == separator[0]
+    positions = np.cumsum(is_separator)[~is_separator]
+    # Close the gap the separator leaves in the codes
+    codes = codes[~is_separator]
+    codes -= codes > separator[0]
+    return np.delete(words, separator[0]), codes, positions
+
+
+def query_terms(query):
+    """
+    Distinct words of a query, split like the messages are
+    """
+    return list(dict.fromkeys(word_re.findall(query.lower())))
+
+
+class SearchIndex:
+    """
+    Postings of every word of a chat: the sorted row positions of the messages containing it, and
+    how many of them each user sent in each month. A word's postings are one dictionary lookup and
+    two offsets away; several words are intersected starting from the rarest.
+    """
+
+    def __init__(self, vocabulary, word_codes, rows, user_codes, month_codes, n_users):
+        self.vocabulary = vocabulary
+        self._codes = {word: code for code, word in enumerate(vocabulary)}
+        self._user_codes = user_codes
+        self._month_codes = month_codes
+        self._n_users = max(n_users, 1)
+        self._n_months = int(month_codes.max()) + 1 if len(month_codes) else 1
+        n_words, n_rows = len(vocabulary), max(len(user_codes), 1)
+
+        # Each (word, message) pair once, ordered by word and then by row
+        keys, _ = _distinct(np.asarray(word_codes, dtype=np.int64) * n_rows + rows)
+        words, self._rows = np.divmod(keys, n_rows)
+        self._offsets = np.searchsorted(words, np.arange(n_words + 1))
+
+        n_cells = self._n_users * self._n_months
+        cells = user_codes[self._rows].astype(np.int64) * self._n_months + month_codes[self._rows]
+        cell_keys, self._cell_counts = _distinct(words * n_cells + cells)
+        cell_words, self._cells = np.divmod(cell_keys, n_cells)
+        self._cell_offsets = np.searchsorted(cell_words, np.arange(n_words + 1))
+
+    @classmethod
+    def build(cls, df, user_codes, month_codes, n_users, first_row=0, index=None):
+        """
+        Index of the searchable messages of df, whose rows are numbered from first_row.
+        Given an index of the rows before them, its postings are merged in instead of re-splitting them.
+        """
+        rows = np.flatnonzero(searchable(df))
+        vocabulary, word_codes, positions = split_words(df['Message'].to_numpy()[rows])
+        rows = rows[positions] + first_row
+        if index is not None:
+            codes = pd.Index(index.vocabulary).get_indexer(vocabulary)
+            new = codes == -1
+            codes[new] = len(index.vocabulary) + np.arange(new.sum())
+            word_codes = np.concatenate([np.repeat(np.arange(len(index.vocabulary)), np.diff(index._offsets)),
+                                         codes[word_codes]])
+            rows = np.concatenate([index._rows, rows])
+            vocabulary = np.concatenate([index.vocabulary, vocabulary[new]])
+        return cls(vocabulary, word_codes, rows, user_codes, month_codes, n_users)
+
+    def _word_codes(self, query):
+        """
+        Codes of the words of query, None when one of them never occurs
+        """
+        codes = [self._codes.get(term, -1) for term in query_terms(query)]
+        return None if not codes or -1 in codes else codes
+
+    def _postings(self, code):
+        return self._rows[self._offsets[code]:self._offsets[code + 1]]
+
+    def find(self, query, start=0, stop=None, user=None):
+        """
+        Sorted row positions in [start, stop) of the messages (of the user code) containing every word of query
+        """
+        codes = self._word_codes(query)
+        if codes is None:
+            return np.empty(0, dtype=np.int64)
+        postings = sorted((self._postings(code) for code in codes), key=len)
+        rows = postings[0]
+        stop = len(self._user_codes) if stop is None else stop
+        rows = rows[np.searchsorted(rows, start):np.searchsorted(rows, stop)]
+        for other in postings[1:]:
+            found = np.minimum(np.searchsorted(other, rows), len(other) - 1)
+            rows = rows[other[found] == rows]
+        if user is not None:
+            rows = rows[self._user_codes[rows] == user]
+        return rows
+
+    def counts(self, query, start=0, stop=None):
+        """
+        (users, months) numbers of messages in [start, stop) containing every word of query
+        """
+        n_cells = self._n_users * self._n_months
+        codes = self._word_codes(query)
+        whole = start == 0 and stop in (None, len(self._user_codes))
+        if codes is not None and len(codes) == 1 and whole:
+            cells = slice(self._cell_offsets[codes[0]], self._cell_offsets[codes[0] + 1])
+            counts = np.zeros(n_cells, dtype=np.int64)
+            counts[self._cells[cells]] = self._cell_counts[cells]
+        else:
+            rows = self.find(query, start, stop)
+            cells = self._user_codes[rows].astype(np.int64) * self._n_months + self._month_codes[rows]
+            counts = np.bincount(cells, minlength=n_cells)
+        return counts.reshape(self._n_users, self._n_months)
+
+
+def _distinct(keys):
+    """
+    Sorted distinct keys and how often each occurs (np.unique without its hashing pass)
+    """
+    keys = np.sort(keys)
+    if not len(keys):
+        return keys, keys
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    return keys[starts], np.diff(np.append(starts, len(keys)))
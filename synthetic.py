@@ -0,0 +1,103 @@
+"""
+Deterministic generator of WhatsApp chat exports for benchmarks, as iOS or Android writes them.
+
+    python synthetic.py chat.txt --messages 1000000 --users 40 --seed 7 --format android
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+FIRST_NAMES = ['Alice', 'Bob', 'Charlie', 'Diana', 'Ethan', 'Fatima', 'George', 'Hana', 'Ivan', 'Julia',
+               'Kiran', 'Liam', 'Maya', 'Nabin', 'Olivia', 'Priya', 'Quinn', 'Ravi', 'Sara', 'Tom']
+LAST_NAMES = ['Johnson', 'Smith', 'Davis', 'Martinez', 'Subedi', 'Khan', 'Lee', 'Brown', 'Garcia', 'Sharma']
+WORDS = ('the meeting project team lunch tomorrow today deadline report great thanks please review update '
+         'weekend coffee python pandas chart data plan ready done awesome morning night call later soon '
+         'sure okay yes no maybe idea help question answer slides draft final check time week month').split()
+EMOJIS = ['😀', '😂', '👍', '🎉', '❤️', '🔥', '🙏', '💪', '😅', '🚀', '👍🏽', '👨‍👩‍👧', '🇳🇵', '✅', '☕']
+DOMAINS = ['example.com', 'github.com', 'docs.google.com', 'youtube.com', 'news.ycombinator.com', 'wikipedia.org']
+MEDIA = ['image omitted', 'video omitted', 'audio omitted', 'document omitted', 'sticker omitted', 'GIF omitted']
+# Line prefix of every export format: iOS in US and German locales, Android with 24 and 12-hour clocks
+FORMATS = {
+    'ios': lambda t: f'[{t:%m/%d/%y}, {t.hour % 12 or 12}:{t:%M:%S} {"AM" if t.hour < 12 else "PM"}]',
+    'ios-24h': lambda t: f'[{t:%d.%m.%y}, {t:%H:%M:%S}]',
+    'android': lambda t: f'{t:%d/%m/%Y}, {t:%H:%M} -',
+    'android-12h': lambda t: f'{t.month}/{t.day}/{t:%y}, {t.hour % 12 or 12}:{t:%M} {"am" if t.hour < 12 else "pm"} -',
+}
+
+
+def generate_chat(messages=10_000, users=8, multiline=0.05, emoji_density=0.2, link_density=0.03,
+                  media=0.05, deleted=0.01, seed=0, start=datetime(2021, 1, 1, 8, 0, 0), export_format='ios'):
+    """
+    Yields the lines of a chat export. Every knob is a per-message probability except
+    messages and users; the same arguments always give the same chat.
+    """
+    rng = random.Random(seed)
+    names = [_user_name(i) for i in range(users)]
+    # A few people write most of the messages, like in real groups
+    weights = [1 / (rank + 1) for rank in range(users)]
+    stamp = FORMATS[export_format]
+    android = export_format.startswith('android')
+
+    timestamp = start
+    yield f'{stamp(timestamp)} {names[0]}: \u200eMessages and calls are end-to-end encrypted.\n'
+    for _ in range(messages):
+        timestamp += timedelta(seconds=int(rng.expovariate(1 / 600)) + 1)
+        user = rng.choices(names, weights)[0]
+        roll = rng.random()
+        if roll < media:
+            # Drawn for Android too, so every format gets the same chat
+            kind = rng.choice(MEDIA)
+            text = '<Media omitted>' if android else '\u200e' + kind
+        elif roll < media + deleted:
+            text = 'This message was deleted'
+        else:
+            text = ' '.join(rng.choices(WORDS, k=rng.randint(1, 14)))
+            if rng.random() < emoji_density:
+                text += ' ' + ''.join(rng.choices(EMOJIS, k=rng.randint(1, 3)))
+            if rng.random() < link_density:
+                text += f' https://{rng.choice(DOMAINS)}/{rng.randint(1, 99999)}'
+            if rng.random() < multiline:
+                text += '\n' + ' '.join(rng.choices(WORDS, k=rng.randint(1, 8)))
+        prefix = '\u200e' if roll < media and not android else ''
+        yield f'{prefix}{stamp(timestamp)} {user}: {text}\n'
+
+
+def _user_name(i):
+    first, rest = FIRST_NAMES[i % len(FIRST_NAMES)], i // len(FIRST_NAMES)
+    last, round_ = LAST_NAMES[rest % len(LAST_NAMES)], rest // len(LAST_NAMES)
+    return f'{first} {last}' + (f' {round_ + 1}' if round_ else '')
+
+
+def write_chat(path, **options):
+    """
+    Writes a generated chat to path without holding it in memory
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        batch = []
+        for line in generate_chat(**options):
+            batch.append(line)
+            if len(batch) == 10_000:
+                f.write(''.join(batch))
+                batch = []
+        f.write(''.join(batch))
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic WhatsApp chat export.")
+    parser.add_argument('path')
+    parser.add_argument('--messages', type=int, default=10_000)
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--multiline', type=float, default=0.05)
+    parser.add_argument('--emoji-density', type=float, default=0.2)
+    parser.add_argument('--link-density', type=float, default=0.03)
+    parser.add_argument('--media', type=float, default=0.05)
+    parser.add_argument('--deleted', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', dest='export_format', choices=list(FORMATS), default='ios')
+    args = vars(parser.parse_args(argv))
+    write_chat(args.pop('path'), **args)
+
+
+if __name__ == '__main__':
+    main()
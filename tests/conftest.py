@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# The app's modules live at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# Chats parsed by the tests are cached on disk away from the user's cache
+os.environ.setdefault('CHAT_CACHE_DIR', tempfile.mkdtemp(prefix='chat-analyzer-tests-'))
+
+import synthetic  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def chat_lines():
+    """
+    Messages of a small synthetic chat, one string per message, by (messages, export format)
+    """
+    chats = {}
+
+    def lines(messages=2000, export_format='ios', **options):
+        key = (messages, export_format, tuple(sorted(options.items())))
+        if key not in chats:
+            chats[key] = list(synthetic.generate_chat(messages=messages, export_format=export_format, **options))
+        return chats[key]
+
+    return lines
@@ -0,0 +1,108 @@
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('streamlit')
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Runs app.py with a chat file (the bundled sample by default) in place of a file upload
+SCRIPT = '''
+import os
+import runpy
+import sys
+
+import streamlit as st
+
+sys.path.insert(0, {root!r})
+os.chdir({root!r})
+
+
+class Upload:
+    name = os.path.basename({chat!r})
+    file_id = {chat!r}
+
+    def getvalue(self):
+        with open({chat!r}, 'rb') as f:
+            return f.read()
+
+
+st.sidebar.file_uploader = lambda *args, **kwargs: [Upload()]
+runpy.run_path('app.py', run_name='__main__')
+'''
+
+
+def start(chat=ROOT / 'chat_file.txt'):
+    app = AppTest.from_string(SCRIPT.format(root=str(ROOT), chat=str(chat)), default_timeout=300)
+    app.run()
+    assert not app.exception
+    return app
+
+
+@pytest.fixture
+def app():
+    return start()
+
+
+def show(app, user, period='All time', dates=None):
+    app.sidebar.selectbox[0].select(user)
+    app.sidebar.selectbox[1].select(period)
+    if dates is not None:
+        app.run()
+        app.sidebar.date_input[0].set_value(dates)
+    app.sidebar.button[0].click().run()
+    assert not app.exception, [e.message for e in app.exception]
+    assert not app.error
+
+
+@pytest.mark.parametrize('period', ['All time', 'Last 30 days'])
+def test_every_user_page_renders(app, period):
+    import matplotlib.pyplot as plt
+
+    for user in app.sidebar.selectbox[0].options[:3]:
+        show(app, user, period)
+        titles = [title.value for title in app.title]
+        assert {'Word Cloud', 'Most Common Words', 'Conversations', 'Keyword Search'} <= set(titles)
+        # The words and links metrics are filled in once their section is computed
+        assert all(metric.value != '…' for metric in app.metric)
+    assert plt.get_fignums() == []
+
+
+def test_overall_stats(app):
+    show(app, 'Overall')
+    assert [metric.value for metric in app.metric][:4] == ['215', '1020', '48', '2']
+    assert 'Most Busy Users' in [title.value for title in app.title]
+    assert app.sidebar.expander[-1].label == '⏱️ Performance'
+
+
+def test_keyword_search(app):
+    show(app, 'Overall')
+    app.text_input[0].input('meeting').run()
+    assert not app.exception
+    assert 'Messages Found' in [metric.label for metric in app.metric]
+
+
+def test_empty_custom_range(app):
+    # The sample chat has no messages from 16 to 20 August 2025
+    show(app, 'Overall', 'Custom range', (date(2025, 8, 17), date(2025, 8, 19)))
+    assert [info.value for info in app.info] == ["No messages in the selected period."]
+    assert 'Word Cloud' not in [title.value for title in app.title]
+    assert app.sidebar.expander[-1].label == '⏱️ Performance'
+
+
+def test_user_absent_from_the_period(tmp_path):
+    chat = tmp_path / 'chat.txt'
+    lines = [f'[1/{day}/25, 10:00:00 AM] Dave: hello from january' for day in range(1, 10)]
+    lines += [f'[2/{day}/25, 10:00:00 AM] {user}: hello from february' for day in range(1, 10)
+              for user in ('Erin', 'Frank')]
+    chat.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    app = start(chat)
+
+    show(app, 'Dave', 'Custom range', (date(2025, 2, 1), date(2025, 2, 9)))
+    assert [info.value for info in app.info] == ["No messages in the selected period."]
+    # Everyone else still gets the whole page for that period
+    show(app, 'Erin', 'Custom range', (date(2025, 2, 1), date(2025, 2, 9)))
+    assert not app.info
+    assert 'Conversations' in [title.value for title in app.title]
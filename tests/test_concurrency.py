@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import helper
+import preprocessor
+
+# Every helper the app prefetches into its section pool, with the options it passes
+CALLS = [
+    ('fetch_stats', {}), ('message_counts', {}), ('link_domains', {}), ('monthly_timeline', {}),
+    ('most_active_weekdays', {}), ('most_active_months', {}), ('wordcloud_frequencies', {}),
+    ('most_common_words', {}), ('common_phrases', {'kind': 'bigrams'}), ('common_phrases', {'kind': 'trigrams'}),
+    ('emoji_helper', {}), ('activity_heatmap_normalized', {}), ('conversation_sessions', {}),
+    ('response_times', {}), ('reply_matrix', {}), ('search_messages', {'query': 'meeting'}),
+    ('keyword_users', {'query': 'meeting'}), ('keyword_timeline', {'query': 'meeting'}),
+]
+
+
+def assert_same(a, b):
+    if isinstance(a, pd.DataFrame):
+        pd.testing.assert_frame_equal(a, b)
+    elif isinstance(a, pd.Series):
+        pd.testing.assert_series_equal(a, b)
+    elif isinstance(a, np.ndarray):
+        np.testing.assert_array_equal(a, b)
+    elif isinstance(a, (tuple, list)):
+        assert len(a) == len(b)
+        for x, y in zip(a, b):
+            assert_same(x, y)
+    else:
+        assert a == b
+
+
+def run(name, options, user, df, window):
+    return getattr(helper, name)(user, df, window, **options)
+
+
+@pytest.mark.parametrize('windowed', [False, True])
+def test_helpers_agree_when_run_concurrently(chat_lines, windowed):
+    text = ''.join(chat_lines(messages=5000, users=6))
+    # Separate frames get separate aggregate stores: one filled in order, one by many threads at once
+    sequential_df, concurrent_df = preprocessor.preprocess(text), preprocessor.preprocess(text)
+    timestamps = sequential_df['Timestamp']
+    window = (timestamps.iloc[1000], timestamps.iloc[4000]) if windowed else None
+    jobs = [(name, options, user) for name, options in CALLS for user in ('Overall', 'Bob Johnson')]
+
+    expected = [run(name, options, user, sequential_df, window) for name, options, user in jobs]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        # Each job twice, so threads race to build the same parts
+        futures = [pool.submit(run, name, options, user, concurrent_df, window)
+                   for _ in range(2) for name, options, user in jobs]
+        results = [future.result() for future in futures]
+
+    for result, want in zip(results, expected * 2):
+        assert_same(result, want)
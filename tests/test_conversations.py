@@ -0,0 +1,84 @@
+from collections import Counter, defaultdict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import helper
+import preprocessor
+
+
+@pytest.fixture(scope='module')
+def df(chat_lines):
+    return preprocessor.preprocess(''.join(chat_lines(messages=3000, users=6)))
+
+
+def reference(df, gap):
+    """
+    Sessions and replies of every row, one message at a time
+    """
+    sessions, replies, times = [], Counter(), defaultdict(list)
+    previous = None
+    for row in df.itertuples(index=False):
+        if previous is None or (row.Timestamp - previous.Timestamp).total_seconds() > gap * 60:
+            sessions.append({'Start': row.Timestamp, 'last': row.Timestamp, 'Messages': 0, 'users': set()})
+        elif row.User != previous.User:
+            replies[row.User, previous.User] += 1
+            times[row.User].append((row.Timestamp - previous.Timestamp).total_seconds() / 60)
+        session = sessions[-1]
+        session['last'] = row.Timestamp
+        session['Messages'] += 1
+        session['users'].add(row.User)
+        previous = row
+    return sessions, replies, times
+
+
+@pytest.mark.parametrize('gap', [5, 60])
+@pytest.mark.parametrize('windowed', [False, True])
+def test_conversations_match_a_row_by_row_reference(df, gap, windowed):
+    window = (df['Timestamp'].iloc[500], df['Timestamp'].iloc[2500]) if windowed else None
+    rows = df if window is None else df[(df['Timestamp'] >= window[0]) & (df['Timestamp'] < window[1])]
+    sessions, replies, times = reference(rows, gap)
+    user = rows['User'].value_counts().index[1]
+
+    table = helper.conversation_sessions('Overall', df, window, gap=gap)
+    assert table['Start'].tolist() == [session['Start'] for session in sessions]
+    assert table['Messages'].tolist() == [session['Messages'] for session in sessions]
+    assert table['Participants'].tolist() == [len(session['users']) for session in sessions]
+    assert table['Minutes'].tolist() == [np.round((s['last'] - s['Start']).total_seconds() / 60, 1)
+                                       for s in sessions]
+    mine = helper.conversation_sessions(user, df, window, gap=gap)
+    assert mine['Start'].tolist() == [session['Start'] for session in sessions if user in session['users']]
+
+    matrix = helper.reply_matrix('Overall', df, window, gap=gap)
+    assert {(a, b): int(matrix.loc[a, b]) for a in matrix.index for b in matrix.columns
+            if matrix.loc[a, b]} == dict(replies)
+    sent_received = helper.reply_matrix(user, df, window, gap=gap)
+    assert sent_received['Sent'].sum() == sum(n for (a, _), n in replies.items() if a == user)
+    assert sent_received['Received'].sum() == sum(n for (_, b), n in replies.items() if b == user)
+
+    response = helper.response_times('Overall', df, window, gap=gap)
+    expected = pd.DataFrame({
+        'Replies': {name: len(minutes) for name, minutes in times.items()},
+        'Median': {name: np.round(np.median(minutes), 1) for name, minutes in times.items()},
+        'P95': {name: np.round(np.percentile(minutes, 95), 1) for name, minutes in times.items()},
+    })
+    pd.testing.assert_frame_equal(response.sort_index(), expected.sort_index(), check_names=False,
+                                  check_dtype=False, check_index_type=False)
+
+
+def test_empty_window_and_absent_user(df):
+    empty = (pd.Timestamp('2000-01-01'), pd.Timestamp('2000-01-02'))
+    for user in ['Overall', 'Bob Johnson']:
+        assert helper.conversation_sessions(user, df, empty).empty
+        assert helper.response_times(user, df, empty).empty
+        assert helper.reply_matrix(user, df, empty).empty
+
+    # Nobody but the first sender wrote in the window of their first message alone
+    first = df['Timestamp'].iloc[0]
+    window = (first, first + pd.Timedelta(seconds=1))
+    absent = next(user for user in df['User'].unique() if user != df['User'].iloc[0])
+    assert helper.conversation_sessions(absent, df, window).empty
+    assert helper.response_times(absent, df, window).empty
+    assert helper.reply_matrix(absent, df, window).empty
+    assert len(helper.conversation_sessions('Overall', df, window)) == 1
@@ -0,0 +1,63 @@
+from collections import Counter
+
+import pandas as pd
+import pytest
+
+import preprocessor
+
+
+def parse(lines, export_format):
+    return preprocessor.preprocess(''.join(lines), export_format=export_format)
+
+
+def reference_merge(frames):
+    """
+    merge_chats one row at a time: the k-th copy of a (timestamp, user, message) in an export
+    is the k-th copy of that message in the chat, and the latest export's row of it is kept
+    """
+    frames = sorted(frames, key=lambda df: df['Timestamp'].iloc[0])
+    combined = pd.concat([df.astype({'User': object}) for df in frames], ignore_index=True)
+    kept, position = {}, 0
+    for df in frames:
+        seen = Counter()
+        for row in df.itertuples(index=False):
+            message = row.Message.rstrip(preprocessor.TRAILING_MARKS) if isinstance(row.Message, str) else None
+            key = (row.Timestamp, row.User, message)
+            kept[key, seen[key]] = position
+            seen[key] += 1
+            position += 1
+    rows = sorted(kept.values(), key=lambda p: (combined['Timestamp'].iloc[p], p))
+    return combined.iloc[rows].reset_index(drop=True)
+
+
+def as_plain(df):
+    return df.astype({'User': object}).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('cuts', [
+    [(0, 1200), (800, 2001)],
+    [(0, 700), (300, 1500), (1400, 2001)],
+    # An export inside another one, and the exports uploaded newest first
+    [(1000, 2001), (1200, 1500), (0, 1100)],
+])
+def test_overlapping_exports_merge_into_the_whole_chat(chat_lines, cuts):
+    lines = chat_lines()
+    export_format = preprocessor.sniff_format(''.join(lines))
+    frames = [parse(lines[start:stop], export_format) for start, stop in cuts]
+
+    merged = preprocessor.merge_chats(frames)
+
+    pd.testing.assert_frame_equal(as_plain(merged), as_plain(parse(lines, export_format)))
+    pd.testing.assert_frame_equal(as_plain(merged), reference_merge(frames))
+
+
+def test_repeats_within_an_export_survive(chat_lines):
+    lines = chat_lines(messages=50)
+    repeated = lines[:20] + [lines[19]] * 2 + lines[20:]
+    export_format = preprocessor.sniff_format(''.join(lines))
+    frames = [parse(repeated[:30], export_format), parse(repeated[10:], export_format)]
+
+    merged = preprocessor.merge_chats(frames)
+
+    assert len(merged) == len(parse(repeated, export_format))
+    pd.testing.assert_frame_equal(as_plain(merged), reference_merge(frames))
@@ -0,0 +1,48 @@
+import helper
+import preprocessor
+
+# Android writes group events as bare lines, without a "User:" part
+ANDROID_CHAT = '''\
+15/03/2024, 09:00 - Messages and calls are end-to-end encrypted. Tap to learn more.
+15/03/2024, 09:01 - Alice created group "Friends"
+15/03/2024, 09:02 - Alice: Hi everyone 👋
+15/03/2024, 09:05 - Bob joined using this group's invite link
+15/03/2024, 09:06 - Bob: Hello!
+15/03/2024, 09:07 - Carol changed this group's icon
+16/03/2024, 18:30 - Alice: <Media omitted>
+16/03/2024, 18:31 - Bob: See you tomorrow
+'''
+
+
+def test_android_group_events_are_not_participants():
+    df = preprocessor.preprocess(ANDROID_CHAT)
+
+    system = df['kind'] == 'system'
+    assert system.sum() == 2
+    assert (df.loc[system, 'User'] == preprocessor.NOTIFICATION_USER).all()
+    assert set(df.loc[~system, 'User']) == {'Alice', 'Bob'}
+
+    busy, percentages = helper.most_busy_users(df)
+    assert busy.to_dict() == {'Alice': 2, 'Bob': 2}
+    assert percentages['Percentage'].sum() == 100
+    assert 'created' not in helper.most_common_words('Overall', df)[0].tolist()
+
+
+IOS_MEDIA_CHAT = '''\
+[15/03/2024, 09:00:00] Alice: ‎GIF omitted
+[15/03/2024, 09:01:00] Bob: <GIF omitted>
+[15/03/2024, 09:02:00] Alice: ‎Contact card omitted
+[15/03/2024, 09:03:00] Bob: ‎video note omitted
+[15/03/2024, 09:04:00] Alice: ‎sticker omitted
+[15/03/2024, 09:05:00] Bob: See you tomorrow
+'''
+
+
+def test_omitted_placeholders_are_media():
+    df = preprocessor.preprocess(IOS_MEDIA_CHAT)
+
+    assert df['kind'].tolist() == ['media'] * 5 + ['text']
+    assert helper.fetch_stats('Overall', df)[2] == 5
+    words = [word.lower() for word in helper.most_common_words('Overall', df)[0]]
+    assert 'omitted' not in words and 'gif' not in words
+    assert 'gif omitted' not in helper.common_phrases('Overall', df)['Phrase'].str.lower().tolist()
@@ -0,0 +1,82 @@
+from datetime import datetime
+
+import pytest
+
+import aggregates
+import helper
+import preprocessor
+import search
+import synthetic
+
+QUERIES = ['meeting', 'Project DEADLINE', 'coffee python pandas', "don't", 'edited', 'nowhere', 'the the']
+
+
+@pytest.fixture(scope='module')
+def lines(chat_lines):
+    # Apostrophes, an edit marker and a separator character, which the synthetic chat doesn't have
+    stamp = synthetic.FORMATS['ios']
+    extra = [f'{stamp(datetime(2021, 3, 1, 9, minute))} Alice Johnson: {text}\n' for minute, text in enumerate([
+        "I don't know about the meeting",
+        "Don't forget the coffee <This message was edited>",
+        'edited\x1fmeeting notes',
+    ])]
+    return chat_lines(messages=3000, users=6) + extra
+
+
+@pytest.fixture(scope='module')
+def df(lines):
+    return preprocessor.preprocess(''.join(lines))
+
+
+def naive_rows(df, query, user=None, window=None):
+    """
+    Row positions of the searchable messages containing every word of query, one message at a time
+    """
+    terms = set(search.query_terms(query))
+    rows = []
+    for position, (row, indexed) in enumerate(zip(df.itertuples(index=False), search.searchable(df))):
+        if not indexed or not terms or (user is not None and row.User != user):
+            continue
+        if window is not None and not window[0] <= row.Timestamp < window[1]:
+            continue
+        text = row.Message.lower().replace(search.EDITED_MARKER, ' ').replace(search.SEPARATOR, ' ')
+        if terms <= set(search.word_re.findall(text)):
+            rows.append(position)
+    return rows
+
+
+@pytest.mark.parametrize('query', QUERIES)
+@pytest.mark.parametrize('windowed', [False, True])
+def test_search_matches_a_naive_scan(df, query, windowed):
+    window = (df['Timestamp'].iloc[700], df['Timestamp'].iloc[2600]) if windowed else None
+    for user in [None, 'Alice Johnson', 'Bob Johnson']:
+        selected_user = 'Overall' if user is None else user
+        expected = naive_rows(df, query, user, window)
+
+        found, latest = helper.search_messages(selected_user, df, window, query=query, limit=10)
+        assert found == len(expected)
+        assert latest['Timestamp'].tolist() == df['Timestamp'].iloc[expected[::-1][:10]].tolist()
+
+        mentions = helper.keyword_users(selected_user, df, window, query=query)
+        by_user = df.iloc[expected]['User'].astype(object).value_counts()
+        assert dict(zip(mentions['User'], mentions['Mentions'])) == by_user.to_dict()
+
+        timeline = helper.keyword_timeline(selected_user, df, window, query=query)
+        assert timeline['Mentions'].sum() == len(expected)
+        months = df.iloc[expected]['Timestamp'].dt.strftime('%B-%Y').value_counts()
+        assert dict(zip(timeline['time'], timeline['Mentions'])) == {
+            time: months.get(time, 0) for time in timeline['time']}
+
+
+def test_extended_index_matches_a_naive_scan(lines, df):
+    head = preprocessor.preprocess(''.join(lines[:1800]))
+    aggregates.get_aggregates(head).search('meeting', 'Overall')
+    text = ''.join(lines)
+    tail = text[len(''.join(lines[:1800])):]
+    extended = preprocessor.preprocess_tail(head, tail, preprocessor.sniff_format(text))
+    store = aggregates.extend_aggregates(head, extended)
+
+    assert 'search' in store._parts
+    for query in QUERIES:
+        assert store.search(query, 'Overall').tolist() == naive_rows(df, query)
+        assert store.search(query, 'Bob Johnson').tolist() == naive_rows(df, query, 'Bob Johnson')
@@ -0,0 +1,106 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import preprocessor
+import synthetic
+
+# strptime layout of each synthetic format's timestamps, what parse_timestamps must agree with
+STRPTIME = {
+    'ios': '%m/%d/%y, %I:%M:%S %p',
+    'ios-24h': '%d.%m.%y, %H:%M:%S',
+    'android': '%d/%m/%Y, %H:%M',
+    'android-12h': '%m/%d/%y, %I:%M %p',
+}
+
+# Every hour, 12:xx AM and PM included, leap days, month and year ends and both sides of the %y pivot
+TIMES = ([datetime(2021, 3, 7, hour, 5, 9) for hour in range(24)]
+         + [datetime(2024, 2, 29, 0, 0, 0), datetime(2024, 2, 29, 12, 59, 59), datetime(2023, 12, 31, 23, 59, 1),
+            datetime(1969, 1, 1, 0, 30, 0), datetime(2068, 12, 31, 12, 0, 0), datetime(2000, 10, 10, 10, 10, 10)])
+
+
+def stamps(export_format, times):
+    # The timestamp part of each message line, without brackets or the dash after it
+    return [synthetic.FORMATS[export_format](t).strip('[]').removesuffix(' -') for t in times]
+
+
+def test_formats_cover_every_synthetic_layout():
+    assert set(STRPTIME) == set(synthetic.FORMATS)
+
+
+@pytest.mark.parametrize('name', list(synthetic.FORMATS))
+def test_timestamps_match_pandas(chat_lines, name):
+    export_format = preprocessor.sniff_format(''.join(chat_lines(messages=500, export_format=name)))
+    timestamps = stamps(name, TIMES)
+
+    parsed = preprocessor.parse_timestamps(timestamps, export_format)
+
+    expected = pd.to_datetime(timestamps, format=STRPTIME[name])
+    assert (parsed == expected.to_numpy()).all()
+    if ':%S' not in STRPTIME[name]:
+        # Formats without seconds lose them
+        assert (parsed == pd.DatetimeIndex(TIMES).floor('min').to_numpy()).all()
+    else:
+        assert (parsed == pd.DatetimeIndex(TIMES).to_numpy()).all()
+
+
+@pytest.mark.parametrize('name, timestamp', [
+    ('ios', '02/29/23, 10:00:00 AM'),      # not a leap year
+    ('ios', '02/30/24, 10:00:00 AM'),
+    ('ios', '13/01/24, 10:00:00 AM'),      # no 13th month
+    ('ios', '01/01/24, 13:00:00 PM'),      # no 13 o'clock on a 12-hour clock
+    ('ios', '01/01/24, 0:00:00 AM'),
+    ('ios-24h', '30.02.24, 10:00:00'),
+    ('ios-24h', '01.01.24, 24:00:00'),
+    ('android', '31/04/2024, 10:00'),
+    ('android-12h', '4/31/24, 10:00 am'),
+])
+def test_invalid_timestamps_are_rejected_like_pandas(name, timestamp):
+    export_format = preprocessor.sniff_format(''.join(synthetic.generate_chat(messages=50, export_format=name)))
+    with pytest.raises(ValueError):
+        pd.to_datetime([timestamp], format=STRPTIME[name])
+    with pytest.raises(ValueError):
+        preprocessor.parse_timestamps([timestamp], export_format)
+
+
+def test_missing_fields_are_rejected():
+    with pytest.raises(ValueError):
+        preprocessor.parse_timestamps(['01/02/24, 10:00 AM'], preprocessor.IOS_FORMAT)
+
+
+@pytest.mark.parametrize('name', list(synthetic.FORMATS))
+def test_sniffed_format_parses_the_whole_chat(chat_lines, name):
+    lines = chat_lines(messages=2000, export_format=name)
+    df = preprocessor.preprocess(''.join(lines))
+    reference = preprocessor.preprocess(''.join(chat_lines(messages=2000)))
+
+    # The same chat in every format, down to the minute when the format has no seconds
+    expected = reference['Timestamp'].dt.floor('s' if ':%S' in STRPTIME[name] else 'min')
+    assert (df['Timestamp'].to_numpy() == expected.to_numpy()).all()
+
+
+def lines_of(dates, stamp):
+    return ''.join(f'{stamp(t)} Alice: hello\n' for t in dates)
+
+
+def test_day_month_tie_broken_by_ascending_dates():
+    # Every day is 12 or less, but only day-first keeps these dates in order
+    dates = [datetime(2021, 3, 1, 9), datetime(2021, 3, 2, 9), datetime(2021, 3, 5, 9), datetime(2021, 3, 11, 9),
+             datetime(2021, 4, 3, 9)]
+    day_first = lambda t: f'[{t:%d/%m/%y}, {t.hour % 12 or 12}:{t:%M:%S} {"AM" if t.hour < 12 else "PM"}]'
+    export_format = preprocessor.sniff_format(lines_of(dates, day_first))
+    assert export_format.order == 'dmy'
+
+    df = preprocessor.preprocess(lines_of(dates, day_first))
+    assert df['Timestamp'].tolist() == [pd.Timestamp(t) for t in dates]
+
+
+@pytest.mark.parametrize('line, order', [
+    # A single date can't tell: 12-hour clocks are read month first, 24-hour ones day first
+    ('[01/02/21, 10:00:00 AM] Alice: hello\n', 'mdy'),
+    ('01/02/2021, 10:00 - Alice: hello\n', 'dmy'),
+    ('[2021-02-01, 10:00:00] Alice: hello\n', 'ymd'),
+])
+def test_ambiguous_single_date(line, order):
+    assert preprocessor.sniff_format(line).order == order
@@ -0,0 +1,69 @@
+import os
+import string
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from preprocessor import NOTIFICATION_USER
+
+DIRECTION_MARKS = r'[\u200e\u200f\u202a-\u202e]'
+
+# Bundled lists, one word per line, so nothing is downloaded at runtime
+STOPWORDS_DIR = Path(__file__).parent / 'stopwords'
+# Languages whose stopwords are left out of common words and the word cloud, e.g. "english,nepali,hindi"
+STOPWORD_LANGUAGES = tuple(os.environ.get('CHAT_STOPWORD_LANGUAGES', 'english').split(','))
+
+
+def stopword_languages():
+    return sorted(path.stem for path in STOPWORDS_DIR.glob('*.txt'))
+
+
+@lru_cache(maxsize=None)
+def stop_words(languages=STOPWORD_LANGUAGES):
+    """
+    Union of the bundled stopword lists of the given languages, read once per process
+    """
+    words = set()
+    for language in languages:
+        path = STOPWORDS_DIR / f'{language.strip().lower()}.txt'
+        if not path.is_file():
+            raise ValueError(f"No stopword list for {language!r}, available: {', '.join(stopword_languages())}")
+        words.update(line.strip() for line in path.read_text(encoding='utf-8').splitlines() if line.strip())
+    return frozenset(words)
+
+
+def word_messages(df):
+    """
+    Boolean mask of the messages whose words count towards common words and the word cloud
+    """
+    return (
+        (df['User'] != NOTIFICATION_USER)
+        & (df['kind'] == 'text')
+        & ~df['Message'].str.contains("This message was edited", na=False)
+    ).to_numpy()
+
+
+def tokenize(df, stop_words):
+    """
+    Splits every message into words once.
+    Returns the number of words in each message, and a (message_id, token) frame of the words
+    left after dropping media placeholders, deleted/edited notices, stopwords and punctuation.
+    message_id is the row position in df.
+    """
+    words = df['Message'].reset_index(drop=True).str.split().explode()
+    words = words[words.notna()]
+    message_ids = words.index.to_numpy()
+    words_per_message = np.bincount(message_ids, minlength=len(df)).astype(np.int64)
+
+    words = words[word_messages(df)[message_ids]]
+    words = words.str.replace(DIRECTION_MARKS, '', regex=True)
+    words = words[~words.str.lower().isin(stop_words)].str.strip(string.punctuation)
+    words = words[words.str.len() > 1]
+
+    tokens = pd.DataFrame({
+        'message_id': words.index.to_numpy(dtype=np.int32),
+        'token': pd.Categorical(words.to_numpy()),
+    })
+    return words_per_message, tokens
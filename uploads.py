@@ -0,0 +1,104 @@
+"""
+Uploaded exports: plain .txt chats and .zip archives from "Export chat" with media.
+
+Only the chat text is read out of an archive, in memory, so the media in it is never extracted.
+Exports are decoded while they are parsed, as UTF-8 or UTF-16 with or without a byte order mark.
+Several exports are parsed in parallel worker processes and merged with preprocessor.merge_chats.
+"""
+import codecs
+import io
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import preprocessor
+
+PARSE_WORKERS = int(os.environ.get('CHAT_PARSE_WORKERS', os.cpu_count() or 1))
+# Below this many bytes in total, starting worker processes costs more than parsing in this one
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+
+# Checked in this order, the UTF-32 LE mark starts with the UTF-16 LE one
+BOMS = [(codecs.BOM_UTF32_LE, 'utf-32-le'), (codecs.BOM_UTF32_BE, 'utf-32-be'), (codecs.BOM_UTF8, 'utf-8'),
+        (codecs.BOM_UTF16_LE, 'utf-16-le'), (codecs.BOM_UTF16_BE, 'utf-16-be')]
+# Bytes looked at to guess the encoding of an export without a byte order mark
+SNIFF_BYTES = 4096
+
+
+def sniff_encoding(head):
+    """
+    Returns (encoding, byte order mark length) of an export from its first bytes
+    """
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding, len(bom)
+    # Timestamps and most names are ASCII, so UTF-16 without a mark has a NUL in every other byte
+    if head[1::2].count(0) > len(head) // 4:
+        return 'utf-16-le', 0
+    if head[0::2].count(0) > len(head) // 4:
+        return 'utf-16-be', 0
+    return 'utf-8', 0
+
+
+def open_text(raw, start=0):
+    """
+    Text stream over a seekable binary export, decoded a chunk at a time as it is read, from the
+    byte offset start on. Invalid bytes are replaced with U+FFFD instead of failing the whole chat.
+    """
+    raw.seek(0)
+    encoding, bom = sniff_encoding(raw.read(SNIFF_BYTES))
+    raw.seek(max(start, bom))
+    return io.TextIOWrapper(raw, encoding=encoding, errors='replace', newline='')
+
+
+def chat_members(names):
+    """
+    The chat .txt files among an archive's member names. Directories and the resource fork
+    copies macOS adds when re-zipping ("__MACOSX/", "._" files) are left out.
+    """
+    return [name for name in names
+            if name.lower().endswith('.txt') and not name.endswith('/') and not name.startswith('__MACOSX/')
+            and not name.rsplit('/', 1)[-1].startswith('._')]
+
+
+def read_exports(files):
+    """
+    Returns (name, chat bytes) for every chat in the uploaded (file name, bytes) pairs,
+    one per .txt file and one per .txt chat inside a .zip
+    """
+    exports = []
+    for name, data in files:
+        if not name.lower().endswith('.zip'):
+            exports.append((name, data))
+            continue
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            members = chat_members(archive.namelist())
+            if not members:
+                raise ValueError(f"No chat .txt file in {name}")
+            exports.extend((f'{name}/{member}', archive.read(member)) for member in members)
+    return exports
+
+
+def parse_export(data):
+    # BytesIO shares the bytes, so the export is never held decoded as a whole
+    return preprocessor.preprocess(open_text(io.BytesIO(data)))
+
+
+def process_pool(workers=PARSE_WORKERS):
+    """
+    Pool for parse_exports, or None when a single worker couldn't beat parsing in this process
+    """
+    if workers < 2:
+        return None
+    # Spawned rather than forked, the server forking itself would copy its threads' locks mid-use
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def parse_exports(exports, pool=None):
+    """
+    Parses every export's bytes, in pool's worker processes when there are several big enough ones.
+    Frames are returned in the order of exports.
+    """
+    if pool is None or len(exports) < 2 or sum(map(len, exports)) < PARALLEL_MIN_BYTES:
+        return [parse_export(data) for data in exports]
+    return list(pool.map(parse_export, exports))